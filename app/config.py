@@ -19,9 +19,29 @@ class Settings(BaseSettings):
     TEST_DB_PASS: str
     TEST_DB_NAME: str
 
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_WARMUP: int = 2
+    DB_STATEMENT_CACHE_SIZE: int = 100
+
+    # Реплика для чтения (необязательна) и окно "липкого" primary после изменений
+    DB_REPLICA_URL: str | None = None
+    DB_REPLICA_STICKY_SECONDS: int = 5
+
     SECRET_KEY: str
     ALGORITHM: str
 
+    USER_CACHE_TTL: float = 60
+    USER_CACHE_MAXSIZE: int = 1024
+
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_QUEUE_LIMIT: int = 64
+
+    SQL_N_PLUS_ONE_THRESHOLD: int = 10
+
     model_config = ConfigDict(env_file=".env")
 
 settings = Settings()
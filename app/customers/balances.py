@@ -0,0 +1,109 @@
+import asyncio
+
+from sqlalchemy import Select, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.customers.models import Customers, customer_balances
+from app.database import dispose_engine, session_scope
+from app.exceptions import AccessDeniedCustomersError, CustomerNotFound
+from app.items.models import item_shares
+# При запуске модуля скриптом приложение не импортируется: регистрируем остальные модели сами,
+# иначе relationship("Users") и relationship("Purchases") не разрешатся
+from app.purchases.models import Purchases
+from app.users.models import Users
+
+
+class CustomerBalanceDAO:
+    "Журнал долгов покупателей по всем покупкам (таблица customer_balances)"
+
+    @classmethod
+    async def apply_item_shares(cls, item_ids, sign: int, session: AsyncSession):
+        """Прибавляет (sign=1) или вычитает (sign=-1) доли товаров item_ids из балансов покупателей.
+        item_ids - список id или select; вызывать до удаления долей и после их добавления"""
+        if isinstance(item_ids, Select):
+            # Подзапрос сам может читать item_shares: не даем ему скоррелироваться с внешним запросом
+            item_ids = item_ids.correlate(None)
+        delta = (
+            select(item_shares.c.customer_id, (func.sum(item_shares.c.amount) * sign).label("amount"))
+            .where(item_shares.c.item_id.in_(item_ids))
+            .group_by(item_shares.c.customer_id)
+            .order_by(item_shares.c.customer_id)  # Одинаковый порядок блокировок строк в параллельных транзакциях
+        )
+        query = pg_insert(customer_balances).from_select(["customer_id", "amount"], delta)
+        query = query.on_conflict_do_update(
+            index_elements=[customer_balances.c.customer_id],
+            set_={"amount": customer_balances.c.amount + query.excluded.amount},
+        )
+        await session.execute(query)
+
+
+    @classmethod
+    async def get_balance(cls, customer_id: int, user_id: int, session: AsyncSession | None = None):
+        query = (
+            select(Customers.created_by, func.coalesce(customer_balances.c.amount, 0).label("amount"))
+            .join(customer_balances, customer_balances.c.customer_id == Customers.id, isouter=True)
+            .where(Customers.id == customer_id)
+        )
+        async with session_scope(session, read_only=True) as session:
+            result = await session.execute(query)
+            balance = result.mappings().first()
+        if not balance:
+            raise CustomerNotFound
+        if balance.created_by != user_id:
+            raise AccessDeniedCustomersError
+        return {"customer_id": customer_id, "amount": balance.amount}
+
+
+    @classmethod
+    async def reconcile(cls, batch_size: int = 1000) -> int:
+        """Пересчитывает журнал из item_shares проходами по batch_size покупателей (keyset по id),
+        каждый проход - в своей короткой транзакции. Возвращает число исправленных строк"""
+        fixed, last_id = 0, 0
+        while True:
+            async with session_scope() as session:
+                result = await session.execute(
+                    select(Customers.id).where(Customers.id > last_id).order_by(Customers.id).limit(batch_size)
+                )
+                customer_ids = result.scalars().all()
+                if not customer_ids:
+                    return fixed
+
+                # Недостающие строки журнала заводим нулевыми, чтобы их можно было заблокировать
+                rows = [{"customer_id": customer_id, "amount": 0} for customer_id in customer_ids]
+                await session.execute(pg_insert(customer_balances).values(rows).on_conflict_do_nothing())
+                # Блокируем строки до подсчета сумм: параллельные apply_item_shares либо уже закоммичены
+                # и видны в item_shares, либо ждут и прибавят свою дельту к исправленному значению
+                await session.execute(
+                    select(customer_balances.c.customer_id)
+                    .where(customer_balances.c.customer_id.in_(customer_ids))
+                    .order_by(customer_balances.c.customer_id)
+                    .with_for_update()
+                )
+
+                owed = (
+                    select(func.coalesce(func.sum(item_shares.c.amount), 0))
+                    .where(item_shares.c.customer_id == customer_balances.c.customer_id)
+                    .scalar_subquery()
+                )
+                query = (
+                    update(customer_balances)
+                    .where(customer_balances.c.customer_id.in_(customer_ids), customer_balances.c.amount != owed)
+                    .values(amount=owed)
+                    .returning(customer_balances.c.customer_id)
+                )
+                result = await session.execute(query)
+                fixed += len(result.all())  # Совпавшие строки не обновляются и в RETURNING не попадают
+                last_id = customer_ids[-1]
+
+
+async def main():
+    try:
+        print(f"Исправлено балансов: {await CustomerBalanceDAO.reconcile()}")
+    finally:
+        await dispose_engine()
+
+
+if __name__ == "__main__":
+    # python -m app.customers.balances
+    asyncio.run(main())
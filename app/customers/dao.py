@@ -1,23 +1,30 @@
-from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.customers.balances import CustomerBalanceDAO
 from app.customers.models import Customers
 from app.customers.schemas import CustomerCreate
 from app.dao.base import BaseDAO
-from app.database import async_session_maker
-from app.exceptions import (AccessDeniedCustomersError, CustomerNotFound,
-                            CustomerNotInPurchaseError, DuplicateRecordError,
-                            NoCustomersInPurchaseError)
+from app.database import session_scope
+from app.exceptions import (AccessDeniedCustomersError, AccessDeniedError,
+                            CustomerNotFound, CustomerNotInPurchaseError,
+                            DuplicateRecordError, NoCustomersInPurchaseError,
+                            PurchaseNotFoundError)
 from app.items.models import Items, item_shares
+from app.purchases.dao import PurchaseDAO
 from app.purchases.models import Purchases, purchase_customers
 
 
 class CustomerDAO(BaseDAO):
     model = Customers
+    not_found_error = CustomerNotFound
+    access_denied_error = AccessDeniedCustomersError
 
 
     @classmethod
-    async def add(cls, customer_data: CustomerCreate, created_by):
-        async with async_session_maker() as session:
+    async def add(cls, customer_data: CustomerCreate, created_by, session: AsyncSession | None = None):
+        async with session_scope(session) as session:
             new_customer = Customers(
                 name=customer_data.name,
                 email = customer_data.email,
@@ -25,110 +32,116 @@ class CustomerDAO(BaseDAO):
             )
             session.add(new_customer)
             await session.flush()
-            await session.commit()
             return new_customer
         
     
     @classmethod
-    async def add_customers_to_purchase(cls, purchase_id: int, customers, user_id):
-        async with async_session_maker() as session:
-            async with session.begin():  # Используем транзакцию
-                if not customers:
-                    return None
-                
-                await cls.check_purchase(purchase_id, user_id, session)
+    async def bump_purchase_versions(cls, rows, session: AsyncSession):
+        customer_ids = sorted({row["id"] for row in rows})
+        if not customer_ids:
+            return
+        # Покупатель отображается во всех своих покупках
+        query = (
+            update(Purchases)
+            .where(
+                Purchases.id == purchase_customers.c.purchase_id,
+                purchase_customers.c.customer_id.in_(customer_ids),
+            )
+            .values(version=Purchases.version + 1)
+        )
+        await session.execute(query)
 
-                added_customers = []
-
-                for customer_id in customers:
-                    print(f"id покупателя: {customer_id}")
-                    # Запрет на добавление чужих пользователей 
-                    query = select(Customers.created_by).where(Customers.id == customer_id)
-                    result = await session.execute(query)
-                    if result.scalars().first() != user_id:
-                        raise AccessDeniedCustomersError
-                    
-                    # Проверка на дубликаты
-                    query = select(purchase_customers).where(
-                        purchase_customers.c.purchase_id == purchase_id,
-                        purchase_customers.c.customer_id == customer_id
-                    )
-                    result = await session.execute(query)
-                    if result.mappings().first():
-                        raise DuplicateRecordError
-            
-                    query = insert(purchase_customers).values(purchase_id=purchase_id, customer_id=customer_id).returning(customer_id)
-                    await session.execute(query)
-                    added_customers.append(customer_id)
-                await session.commit()
-
-                return {"purchase_id": purchase_id, "customers": added_customers}
-            
 
     @classmethod
-    async def get_customers_to_purchase(cls, purchase_id: int, user_id: int):
-        async with async_session_maker() as session:
-            try:
-                await cls.check_purchase(purchase_id, user_id, session)
-
-                query = (
-                    select(
-                        Purchases.name.label("purchase_name"),
-                        func.array_agg(Customers.name).label("customer_names")
-                    )
-                    .select_from(Purchases)
-                    .join(purchase_customers, purchase_customers.c.purchase_id == Purchases.id)
-                    .join(Customers, purchase_customers.c.customer_id == Customers.id)
-                    .where(purchase_customers.c.purchase_id == purchase_id)
-                    .group_by(Purchases.name)
+    async def delete_owned(cls, id: int, user_id: int, session: AsyncSession | None = None):
+        async with session_scope(session) as session:
+            # Покупатель исчезнет из всех своих покупок: меняем их версии в той же транзакции
+            query = (
+                update(Purchases)
+                .where(
+                    Purchases.id == purchase_customers.c.purchase_id,
+                    purchase_customers.c.customer_id == id,
+                    Customers.id == id,
+                    Customers.created_by == user_id,
                 )
-                
-                customers = await session.execute(query)
-                result = customers.mappings().all()
-                
-                return result
-            except Exception as e:
-                await session.rollback()
-                # Log the exception here if needed
-                raise e
+                .values(version=Purchases.version + 1)
+            )
+            await session.execute(query)
+            await super().delete_owned(id, user_id, session)
+
 
-    
     @classmethod
-    async def get_customers_share(cls, purchase_id: int, customer_id: int, user_id: int):
-        async with async_session_maker() as session:
-            await cls.check_purchase(purchase_id, user_id, session)
+    async def add_customers_to_purchase(cls, purchase_id: int, customers, user_id, session: AsyncSession | None = None):
+        async with session_scope(session) as session:  # Используем транзакцию
+            if not customers:
+                return None
+            
+            customer_ids = list(dict.fromkeys(customers))  # Убираем повторы, сохраняя порядок
 
-            # Проверка, что пользователь существует
-            query = (
-                select(Customers.name)  # Выбираем имя покупателя
-                .where(Customers.id == customer_id)
+            # Владелец покупки и свои покупатели из списка - одним запросом
+            owned_customers = (
+                select(func.array_agg(Customers.id))
+                .where(Customers.id.in_(customer_ids), Customers.created_by == user_id)
+                .scalar_subquery()
             )
-
+            query = select(Purchases.created_by, owned_customers.label("owned_ids")).where(Purchases.id == purchase_id)
             result = await session.execute(query)
-            customer = result.scalars().first()
+            purchase = result.mappings().first()
+            if not purchase:
+                raise PurchaseNotFoundError
+            if purchase.created_by != user_id:
+                raise AccessDeniedError
 
-            if not customer:
-                raise CustomerNotFound
+            # Запрет на добавление чужих пользователей
+            if set(customer_ids) - set(purchase.owned_ids or []):
+                raise AccessDeniedCustomersError
 
-            # Проверка, что пользователь участвует в покупке
+            # Один INSERT на весь список, дубликаты пропускаются и вычисляются по RETURNING
             query = (
-                select(item_shares.c.customer_id)  # Выбираем customer_id из item_shares
-                .join(purchase_customers, purchase_customers.c.customer_id == item_shares.c.customer_id)  # Соединяем с purchase_customers
-                .join(Purchases, Purchases.id == purchase_customers.c.purchase_id)  # Соединяем с purchases
-                .where(
-                    (item_shares.c.customer_id == customer_id) &  # Фильтр по customer_id
-                    (Purchases.id == purchase_id)  # Фильтр по purchase_id
-                )
+                pg_insert(purchase_customers)
+                .values([{"purchase_id": purchase_id, "customer_id": customer_id} for customer_id in customer_ids])
+                .on_conflict_do_nothing()
+                .returning(purchase_customers.c.customer_id)
             )
-
-            # Выполнение запроса
             result = await session.execute(query)
-            customer_ids = result.scalars().all()
+            inserted_ids = set(result.scalars().all())
+            await PurchaseDAO.bump_version([purchase_id], session)
 
-            if not customer_ids:
-                raise CustomerNotInPurchaseError
+            duplicate_ids = [customer_id for customer_id in customer_ids if customer_id not in inserted_ids]
+            if duplicate_ids:
+                raise DuplicateRecordError(f"{DuplicateRecordError.detail}: покупатели {duplicate_ids}")
 
-            # Выборка данных
+            return {"purchase_id": purchase_id, "customers": customer_ids}
+            
+
+    @classmethod
+    async def get_customers_to_purchase(cls, purchase_id: int, user_id: int, session: AsyncSession | None = None):
+        async with session_scope(session, read_only=True) as session:
+            query = (
+                select(
+                    Purchases.name.label("purchase_name"),
+                    func.array_agg(Customers.name).label("customer_names")
+                )
+                .select_from(Purchases)
+                .join(purchase_customers, purchase_customers.c.purchase_id == Purchases.id)
+                .join(Customers, purchase_customers.c.customer_id == Customers.id)
+                .where(purchase_customers.c.purchase_id == purchase_id, Purchases.created_by == user_id)
+                .group_by(Purchases.name)
+            )
+            
+            customers = await session.execute(query)
+            result = customers.mappings().all()
+            if not result:
+                # Пустой результат: покупки нет, она чужая или в ней нет покупателей
+                await cls.check_purchase(purchase_id, user_id, session)
+            
+            return result
+
+    
+    @classmethod
+    async def get_customers_share(cls, purchase_id: int, customer_id: int, user_id: int, session: AsyncSession | None = None):
+        async with session_scope(session, read_only=True) as session:
+            # Сумма долей покупателя с проверкой владельца покупки в том же запросе
             query = (
                 select(
                     Customers.name,  # Выбираем имя покупателя
@@ -139,77 +152,129 @@ class CustomerDAO(BaseDAO):
                 .join(Customers, Customers.id == item_shares.c.customer_id)  # Соединяем с customers
                 .where(
                     (Purchases.id == purchase_id) &  # Фильтр по purchase_id
+                    (Purchases.created_by == user_id) &  # Фильтр по владельцу
                     (item_shares.c.customer_id == customer_id)  # Фильтр по customer_id
                 )
                 .group_by(Customers.name)  # Группируем по имени покупателя
             )
 
-            # Выполнение запроса
             result = await session.execute(query)
-            return result.mappings().first()
-    
-    @classmethod
-    async def delete_customer_from_purchase(cls, customer_id: int, purchase_id: int, user_id: int):
-        async with async_session_maker() as session:
+            share = result.mappings().first()
+            if share:
+                return share
+
+            # Пустой результат: выясняем причину
             await cls.check_purchase(purchase_id, user_id, session)
 
-            # Проверка, что покупатель существует
-            query = select(Customers.name).where(Customers.id == customer_id)
+            query = select(Customers.id).where(Customers.id == customer_id)
             result = await session.execute(query)
-            customer = result.scalars().first()
-            if not customer:
+            if result.scalar() is None:
                 raise CustomerNotFound
 
-            # Покупатель не участвует в покупке
-            query = select(purchase_customers).where(purchase_customers.c.customer_id == customer_id, purchase_customers.c.purchase_id == purchase_id)
+            raise CustomerNotInPurchaseError
+    
+    @classmethod
+    async def get_purchase_shares(cls, purchase_id: int, user_id: int, session: AsyncSession | None = None):
+        # Доли по всем участникам покупки одним сгруппированным запросом
+        shares_subquery = (
+            select(
+                item_shares.c.customer_id,
+                func.sum(item_shares.c.amount).label("amount"),
+                func.count(item_shares.c.item_id).label("items_count")
+            )
+            .join(Items, Items.id == item_shares.c.item_id)
+            .where(Items.purchase_id == purchase_id)
+            .group_by(item_shares.c.customer_id)
+            .subquery()
+        )
+        amount = func.coalesce(shares_subquery.c.amount, 0)
+        query = (
+            select(
+                Customers.id.label("customer_id"),
+                Customers.name,
+                amount.label("amount"),
+                func.coalesce(shares_subquery.c.items_count, 0).label("items_count"),
+                func.coalesce(func.round(amount / func.nullif(Purchases.total_amount, 0), 4), 0).label("share")
+            )
+            .select_from(Purchases)
+            .join(purchase_customers, purchase_customers.c.purchase_id == Purchases.id)
+            .join(Customers, Customers.id == purchase_customers.c.customer_id)
+            .join(shares_subquery, shares_subquery.c.customer_id == Customers.id, isouter=True)
+            .where(Purchases.id == purchase_id, Purchases.created_by == user_id)
+            .order_by(Customers.id)
+        )
+
+        async with session_scope(session, read_only=True) as session:
             result = await session.execute(query)
-            if not result.mappings().first():
+            shares = result.mappings().all()
+            if not shares:
+                # Пустой результат: покупки нет, она чужая или в ней нет участников
+                await cls.check_purchase(purchase_id, user_id, session)
+            return shares
+
+
+    @classmethod
+    async def delete_customer_from_purchase(cls, customer_id: int, purchase_id: int, user_id: int, session: AsyncSession | None = None):
+        async with session_scope(session) as session:  # Явная транзакция на все шаги
+            # Удалить покупателя из purchase_customers, только если покупка принадлежит пользователю
+            query = (
+                delete(purchase_customers)
+                .where(
+                    purchase_customers.c.customer_id == customer_id,
+                    purchase_customers.c.purchase_id == purchase_id,
+                    Purchases.id == purchase_customers.c.purchase_id,
+                    Purchases.created_by == user_id
+                )
+                .returning(purchase_customers.c.customer_id)
+            )
+            result = await session.execute(query)
+            if result.scalar() is None:
+                # Ничего не удалено: выясняем причину
+                await cls.check_purchase(purchase_id, user_id, session)
+                query = select(Customers.id).where(Customers.id == customer_id)
+                result = await session.execute(query)
+                if result.scalar() is None:
+                    raise CustomerNotFound
                 raise CustomerNotInPurchaseError
 
-            # Получить список item_id, за которые скидывается customer
+            # Доли затронутых товаров пересчитываются у всех их покупателей:
+            # вычитаем старые доли из журнала балансов, после пересчета прибавим новые
+            affected_items = (
+                select(item_shares.c.item_id)
+                .join(Items, Items.id == item_shares.c.item_id)
+                .where(item_shares.c.customer_id == customer_id, Items.purchase_id == purchase_id)
+            )
+            await CustomerBalanceDAO.apply_item_shares(affected_items, -1, session)
+
+            # Удалить все записи item_shares покупателя по товарам этой покупки
             query = (
-                select(Items.id)
-                .join(item_shares, Items.id == item_shares.c.item_id)
+                delete(item_shares)
                 .where(
-                    (Items.purchase_id == purchase_id) &
-                    (item_shares.c.customer_id == customer_id)
+                    item_shares.c.customer_id == customer_id,
+                    item_shares.c.item_id.in_(select(Items.id).where(Items.purchase_id == purchase_id))
                 )
+                .returning(item_shares.c.item_id)
             )
             result = await session.execute(query)
             item_ids = result.scalars().all()
 
-            # Удлаить все записи item_shares для покупателя, который больше не участвует в покупке
+            # Пересчитать amount в item_shares одним UPDATE ... FROM для всех затронутых товаров
             if item_ids:
-                query = delete(item_shares).where(item_shares.c.item_id.in_(item_ids), item_shares.c.customer_id == customer_id)
-                await session.execute(query)
-
-            # Пересчитать amount в item_shares
-            for item_id in item_ids:
-                customer_count_subquery = (
-                    select(func.count(item_shares.c.customer_id))
-                    .where(item_shares.c.item_id == item_id)
+                customer_counts = (
+                    select(item_shares.c.item_id, func.count().label("customers_count"))
+                    .where(item_shares.c.item_id.in_(item_ids))
                     .group_by(item_shares.c.item_id)
-                    .scalar_subquery()
+                    .subquery()
                 )
-
-                # Получаем цену товара
-                item_price_query = select(Items.price).where(Items.id == item_id)
-                item_price = (await session.execute(item_price_query)).scalar()
-
-                # Рассчитываем новое значение amount
-                new_amount = item_price / customer_count_subquery
-
-                # Обновляем amount в таблице item_shares
                 query = (
                     update(item_shares)
-                    .where(item_shares.c.item_id == item_id)
-                    .values(amount=new_amount)
+                    .where(
+                        item_shares.c.item_id == customer_counts.c.item_id,
+                        Items.id == item_shares.c.item_id
+                    )
+                    .values(amount=Items.price / customer_counts.c.customers_count)
                 )
-
                 await session.execute(query)
+                await CustomerBalanceDAO.apply_item_shares(item_ids, 1, session)
 
-            # Удалить покупателя из purchase_customers
-            query = delete(purchase_customers).where(purchase_customers.c.customer_id == customer_id, purchase_customers.c.purchase_id == purchase_id)
-            await session.execute(query)
-            
-            await session.commit() 
\ No newline at end of file
+            await PurchaseDAO.bump_version([purchase_id], session)
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, Text
+from sqlalchemy import (Column, ForeignKey, Index, Integer, Numeric, String,
+                        Table, Text)
 from sqlalchemy.orm import relationship
 
 from app.database import Base
@@ -10,8 +11,22 @@ class Customers(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(Text, nullable=False)
     email = Column(String(255), nullable=True)
-    created_by = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    created_by = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
 
     creator = relationship("Users", back_populates="customers")
     purchases = relationship("Purchases", secondary="purchase_customers", back_populates="customers")
     items = relationship("Items", secondary="item_shares", back_populates="customers")
+
+    __table_args__ = (
+        # Поиск по названию (pg_trgm): GiST умеет KNN-сортировку name <-> q
+        Index('ix_customers_name_trgm_gist', 'name', postgresql_using='gist', postgresql_ops={'name': 'gist_trgm_ops'}),
+    )
+
+
+# Сколько покупатель должен по всем покупкам: сумма его item_shares, обновляется в тех же транзакциях
+customer_balances = Table(
+    "customer_balances",
+    Base.metadata,
+    Column("customer_id", Integer, ForeignKey("customers.id", ondelete="CASCADE"), primary_key=True),
+    Column("amount", Numeric(12, 2), nullable=False, server_default="0"),
+)
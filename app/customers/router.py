@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.customers.balances import CustomerBalanceDAO
 from app.customers.dao import CustomerDAO
 from app.customers.schemas import CustomerCreate, CustomersList
-from app.exceptions import (AccessDeniedCustomersError, CustomerNotAddedError,
-                            CustomerNotFound, NoCustomersInPurchaseError)
+from app.database import get_session
+from app.exceptions import CustomerNotAddedError, NoCustomersInPurchaseError
+from app.purchases.dao import PurchaseDAO
+from app.responses import (etag_matches, ndjson_response,
+                           not_modified_response, prefetch, purchase_etag)
 from app.users.dependencies import get_current_user
 from app.users.models import Users
 
@@ -14,50 +19,112 @@ router_customers = APIRouter(
 
 
 @router_customers.post("", status_code=201)
-async def add_customer(customer: CustomerCreate, user: Users = Depends(get_current_user)):
-    new_customer = await CustomerDAO.add(customer, created_by=user.id)
+async def add_customer(
+    customer: CustomerCreate,
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session, scope="function"),
+):
+    new_customer = await CustomerDAO.add(customer, created_by=user.id, session=session)
     return new_customer
 
 
 @router_customers.delete("/{customer_id}", status_code=204)
-async def delete_customer(customer_id: int, user: Users = Depends(get_current_user)):
-    customer = await CustomerDAO.find_one_or_none(id=customer_id)
-    if not customer:
-        raise CustomerNotFound
-    if customer.created_by != user.id:
-        raise AccessDeniedCustomersError
-    await CustomerDAO.delete(id=customer.id, created_by=user.id)
+async def delete_customer(
+    customer_id: int,
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session, scope="function"),
+):
+    await CustomerDAO.delete_owned(customer_id, user.id, session)
 
 
 @router_customers.post("/{purchase_id}", status_code=201)
-async def add_customers_to_purchase(purchase_id: int, customers_list: CustomersList, user: Users = Depends(get_current_user)):
-    customers = await CustomerDAO.add_customers_to_purchase(purchase_id, customers_list.customers, user.id)
+async def add_customers_to_purchase(
+    purchase_id: int,
+    customers_list: CustomersList,
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session, scope="function"),
+):
+    customers = await CustomerDAO.add_customers_to_purchase(purchase_id, customers_list.customers, user.id, session)
     if not customers:
         raise CustomerNotAddedError
     return customers
 
 
 @router_customers.delete("/{purchase_id}/{customer_id}", status_code=204)
-async def delete_customer_from_purchase(customer_id: int, purchase_id: int, user: Users = Depends(get_current_user)):
-    await CustomerDAO.delete_customer_from_purchase(customer_id=customer_id, purchase_id=purchase_id, user_id=user.id)
+async def delete_customer_from_purchase(
+    customer_id: int,
+    purchase_id: int,
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session, scope="function"),
+):
+    await CustomerDAO.delete_customer_from_purchase(customer_id=customer_id, purchase_id=purchase_id, user_id=user.id, session=session)
+
+
+@router_customers.get("/stream")
+async def stream_customers(user: Users = Depends(get_current_user)):
+    return ndjson_response(await prefetch(CustomerDAO.stream_all(created_by=user.id)))
 
 
 # GET customers/{purchase_id}
 @router_customers.get("/{purchase_id}")
-async def get_customers_to_purchase(purchase_id: int, user: Users = Depends(get_current_user)):
-    customers = await CustomerDAO.get_customers_to_purchase(purchase_id, user.id)
+async def get_customers_to_purchase(
+    purchase_id: int,
+    request: Request,
+    response: Response,
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session, scope="function"),
+):
+    etag = purchase_etag(purchase_id, await PurchaseDAO.get_version(purchase_id, user.id, session))
+    if etag_matches(request, etag):
+        return not_modified_response(etag)
+
+    customers = await CustomerDAO.get_customers_to_purchase(purchase_id, user.id, session)
+    response.headers["ETag"] = etag
     return customers
 
 
 @router_customers.get("")
-async def get_customers():
-    customers = await CustomerDAO.find_all()
+async def get_customers(
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = None,
+    session: AsyncSession = Depends(get_session, scope="function"),
+):
+    customers, next_cursor = await CustomerDAO.find_page(limit, cursor, session=session)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return customers
 
 
+# Сколько покупатель должен по всем покупкам - одна строка журнала
+@router_customers.get("/{customer_id}/balance")
+async def get_customer_balance(
+    customer_id: int,
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session, scope="function"),
+):
+    return await CustomerBalanceDAO.get_balance(customer_id, user.id, session)
+
+
+# Узнать сколько должен каждый участник покупки
+@router_customers.get("/{purchase_id}/shares")
+async def get_purchase_shares(
+    purchase_id: int,
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session, scope="function"),
+):
+    shares = await CustomerDAO.get_purchase_shares(purchase_id, user.id, session)
+    return shares
+
+
 # Узнать сколько пользователь должен за покупку
 @router_customers.get("/{purchase_id}/shares/{customer_id}")
-async def get_customers_share(purchase_id: int, customer_id: int, user: Users = Depends(get_current_user)):
-    amount_customer = await CustomerDAO.get_customers_share(purchase_id, customer_id, user.id)
+async def get_customers_share(
+    purchase_id: int,
+    customer_id: int,
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session, scope="function"),
+):
+    amount_customer = await CustomerDAO.get_customers_share(purchase_id, customer_id, user.id, session)
     return amount_customer    
 
@@ -18,7 +18,3 @@ class CustomerCreate(BaseModel):
 
 class CustomersList(BaseModel):
     customers: list[int]
-
-    def __init__(self, **data):
-        print("Pydantic parsing:", data)
-        super().__init__(**data)
\ No newline at end of file
@@ -1,41 +1,149 @@
-from sqlalchemy import delete, insert, select, update
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import BigInteger, column, delete, insert, select, tuple_, update, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import async_session_maker
-from app.exceptions import AccessDeniedError, PurchaseNotFoundError
+from app.database import session_scope
+from app.exceptions import (AccessDeniedError, InvalidCursorError,
+                            PurchaseNotFoundError)
 from app.purchases.models import Purchases
 
 # from app.logger import logger
 
 
+def encode_cursor(key_values: list) -> str:
+    "Непрозрачный курсор: значения ключа последней строки страницы"
+    raw = json.dumps(key_values, default=str, ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str, columns: list) -> list:
+    try:
+        key_values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(key_values, list) or len(key_values) != len(columns):
+            raise ValueError
+        # Приводим значения из JSON обратно к типам колонок; чужой тип - ошибка курсора, а не 500 от БД
+        decoded = []
+        for value, col in zip(key_values, columns):
+            python_type = col.type.python_type
+            if value is None:
+                pass
+            elif python_type in (datetime, date):
+                value = python_type.fromisoformat(value)
+                if getattr(value, "tzinfo", None) is not None:
+                    raise ValueError
+            elif python_type is Decimal:
+                if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+                    raise TypeError
+                value = Decimal(value)
+            elif python_type is float and type(value) is int:
+                value = float(value)
+            elif type(value) is not python_type:  # bool не сойдет за int
+                raise TypeError
+            elif python_type is int:
+                bits = 64 if isinstance(col.type, BigInteger) else 32
+                if not -2 ** (bits - 1) <= value < 2 ** (bits - 1):
+                    raise ValueError
+            elif python_type is str and "\x00" in value:
+                raise ValueError  # PostgreSQL не принимает NUL в тексте
+            decoded.append(value)
+        return decoded
+    except (ValueError, TypeError, InvalidOperation, NotImplementedError):
+        raise InvalidCursorError
+
+
 class BaseDAO:
     model = None
+    # Ошибки для проверок владельца (модели с колонкой created_by)
+    not_found_error = None
+    access_denied_error = AccessDeniedError
+
+
+    @classmethod
+    async def bump_purchase_versions(cls, rows, session: AsyncSession):
+        """Общие add/update/upsert/delete вызывают это в той же транзакции для измененных строк.
+        Модели, входящие в покупку, переопределяют метод и меняют purchases.version (ETag)"""
 
 
     @classmethod
-    async def find_one_or_none(cls, **filter_by):
-        async with async_session_maker() as session:
+    async def find_one_or_none(cls, session: AsyncSession | None = None, **filter_by):
+        async with session_scope(session, read_only=True) as session:
             query = select(cls.model.__table__.columns).filter_by(**filter_by)
             result = await session.execute(query)
             return result.mappings().one_or_none()
 
 
     @classmethod
-    async def find_all(cls, **filter_by):
-        async with async_session_maker() as session:
+    async def find_all(cls, session: AsyncSession | None = None, **filter_by):
+        async with session_scope(session, read_only=True) as session:
             query = select(cls.model.__table__.columns).filter_by(**filter_by)
             result = await session.execute(query)
             return result.mappings().all()
-    
+
+
+    @classmethod
+    async def find_page(
+        cls,
+        limit: int = 100,
+        cursor: str | None = None,
+        order_by: str = "id",
+        descending: bool = False,
+        session: AsyncSession | None = None,
+        **filter_by,
+    ):
+        "Keyset-пагинация по (order_by, id): возвращает строки страницы и курсор следующей страницы"
+        table = cls.model.__table__
+        columns = [table.c[order_by]] if order_by == "id" else [table.c[order_by], table.c.id]
+        key = tuple_(*columns) if len(columns) > 1 else columns[0]
+
+        query = select(table.columns).filter_by(**filter_by)
+        if cursor:
+            key_values = decode_cursor(cursor, columns)
+            value = tuple(key_values) if len(key_values) > 1 else key_values[0]
+            query = query.where(key < value if descending else key > value)
+        query = query.order_by(*(col.desc() if descending else col for col in columns)).limit(limit + 1)
+
+        async with session_scope(session, read_only=True) as session:
+            result = await session.execute(query)
+            rows = result.mappings().all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([rows[-1][col.name] for col in columns])
+        return rows, next_cursor
+
+
+    @classmethod
+    async def stream_all(cls, batch_size: int = 1000, **filter_by):
+        "Построчная выдача через серверный курсор: в памяти не больше batch_size строк"
+        query = (
+            select(cls.model.__table__.columns)
+            .filter_by(**filter_by)
+            .order_by(cls.model.__table__.c.id)
+            .execution_options(yield_per=batch_size)
+        )
+        async with session_scope(read_only=True) as session:
+            result = await session.stream(query)
+            async for partition in result.mappings().partitions():
+                for row in partition:
+                    yield row
+
 
     @classmethod
-    async def add(cls, **data):
+    async def add(cls, session: AsyncSession | None = None, **data):
         try:
             query = insert(cls.model).values(**data).returning(cls.model.__table__.columns)
-            async with async_session_maker() as session:
+            async with session_scope(session) as session:
                 result = await session.execute(query)
-                await session.commit()
-                return result.mappings().first()
+                added = result.mappings().first()
+                await cls.bump_purchase_versions([added], session)
+                return added
         except (SQLAlchemyError, Exception) as e:
             if isinstance(e, SQLAlchemyError):
                 msg = "Database Exc: Cannot insert data into table"
@@ -49,20 +157,137 @@ class BaseDAO:
 
 
     @classmethod
-    async def delete(cls, **filter_by):
-        async with async_session_maker() as session:
-            query = delete(cls.model).filter_by(**filter_by)
-            await session.execute(query)
-            await session.commit()
+    async def delete(cls, session: AsyncSession | None = None, **filter_by):
+        async with session_scope(session) as session:
+            query = delete(cls.model).filter_by(**filter_by).returning(cls.model.__table__.columns)
+            result = await session.execute(query)
+            await cls.bump_purchase_versions(result.mappings().all(), session)
+
 
-    
     @classmethod
-    async def update(cls, id: int, **update_values):
-         async with async_session_maker() as session:
+    async def update(cls, id: int, session: AsyncSession | None = None, **update_values):
+         async with session_scope(session) as session:
             query = update(cls.model).filter_by(id=id).values(**update_values).returning(cls.model.__table__.columns)
             result = await session.execute(query)
-            await session.commit()
-            return result.mappings().first()
+            updated = result.mappings().first()
+            if updated is not None:
+                await cls.bump_purchase_versions([updated], session)
+            return updated
+
+
+    @classmethod
+    async def add_many(cls, rows: list[dict], session: AsyncSession | None = None):
+        "Вставка пачки строк одним executemany; строки возвращаются в порядке входных данных"
+        if not rows:
+            return []
+        query = insert(cls.model).returning(*cls.model.__table__.columns, sort_by_parameter_order=True)
+        async with session_scope(session) as session:
+            result = await session.execute(query, rows)
+            added = result.mappings().all()
+            await cls.bump_purchase_versions(added, session)
+            return added
+
+
+    @classmethod
+    async def update_many(cls, rows: list[dict], session: AsyncSession | None = None):
+        "Построчное обновление по id: у каждой строки свои значения, все строки - одним UPDATE ... FROM (VALUES ...)"
+        if not rows:
+            return []
+        table = cls.model.__table__
+        names = list(rows[0])
+        if "id" not in names or any(set(row) != set(names) for row in rows):
+            raise ValueError("update_many: all rows must have the same keys, including id")
+
+        new_values = values(*(column(name, table.c[name].type) for name in names), name="new_values").data(
+            [tuple(row[name] for name in names) for row in rows]
+        )
+        query = (
+            update(table)
+            .where(table.c.id == new_values.c.id)
+            .values({name: new_values.c[name] for name in names if name != "id"})
+            .returning(*table.columns)
+        )
+        async with session_scope(session) as session:
+            result = await session.execute(query)
+            updated = {row["id"]: row for row in result.mappings().all()}
+            await cls.bump_purchase_versions(list(updated.values()), session)
+        return [updated[row["id"]] for row in rows if row["id"] in updated]
+
+
+    @classmethod
+    async def upsert(
+        cls,
+        rows: list[dict],
+        conflict_target: list[str] | None = None,
+        update_columns: list[str] | None = None,
+        session: AsyncSession | None = None,
+    ):
+        """INSERT ... ON CONFLICT: по умолчанию конфликт по первичному ключу и обновление всех переданных колонок.
+        Если обновлять нечего - ON CONFLICT DO NOTHING, и возвращаются только вставленные строки"""
+        if not rows:
+            return []
+        table = cls.model.__table__
+        if conflict_target is None:
+            conflict_target = [c.name for c in table.primary_key.columns]
+        if update_columns is None:
+            update_columns = [name for name in rows[0] if name not in conflict_target]
+
+        query = pg_insert(table)
+        if update_columns:
+            query = query.on_conflict_do_update(
+                index_elements=conflict_target,
+                set_={name: query.excluded[name] for name in update_columns},
+            ).returning(*table.columns, sort_by_parameter_order=True)
+        else:
+            # Пропущенные строки не попадают в RETURNING, сопоставить порядок уже нельзя
+            query = query.on_conflict_do_nothing(index_elements=conflict_target).returning(*table.columns)
+
+        async with session_scope(session) as session:
+            result = await session.execute(query, rows)
+            upserted = result.mappings().all()
+            await cls.bump_purchase_versions(upserted, session)
+            return upserted
+
+
+    @classmethod
+    async def check_owner(cls, id: int, user_id: int, session):
+        "Различает «не найдено» и «нет доступа» после того, как запрос с фильтром по владельцу не затронул строк"
+        query = select(cls.model.created_by).where(cls.model.id == id)
+        result = await session.execute(query)
+        created_by = result.scalars().first()
+        if created_by is None:
+            raise cls.not_found_error
+        if created_by != user_id:
+            raise cls.access_denied_error
+
+
+    @classmethod
+    async def delete_owned(cls, id: int, user_id: int, session: AsyncSession | None = None):
+        async with session_scope(session) as session:
+            query = (
+                delete(cls.model)
+                .where(cls.model.id == id, cls.model.created_by == user_id)
+                .returning(cls.model.id)
+            )
+            result = await session.execute(query)
+            if result.scalar() is None:
+                await cls.check_owner(id, user_id, session)
+
+
+    @classmethod
+    async def update_owned(cls, id: int, user_id: int, session: AsyncSession | None = None, **update_values):
+        async with session_scope(session) as session:
+            query = (
+                update(cls.model)
+                .where(cls.model.id == id, cls.model.created_by == user_id)
+                .values(**update_values)
+                .returning(cls.model.__table__.columns)
+            )
+            result = await session.execute(query)
+            updated = result.mappings().first()
+            if updated is None:
+                await cls.check_owner(id, user_id, session)
+            return updated
 
 
     async def check_purchase(purchase_id: int, user_id: int, session):
@@ -71,6 +296,6 @@ class BaseDAO:
         result = result.scalars().first()
         if not result:
             raise PurchaseNotFoundError
-        
+
         if result != user_id:
-            raise AccessDeniedError
\ No newline at end of file
+            raise AccessDeniedError
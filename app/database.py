@@ -1,21 +1,182 @@
-from sqlalchemy import NullPool
+import asyncio
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from fastapi import Request
+from sqlalchemy import NullPool, text
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from app.config import settings
 
+# Время ожидания соединения из пула (для метрик), отдельно для primary и реплики
+pool_stats = {"primary": Counter(), "replica": Counter()}
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    "Пул, который считает время ожидания свободного соединения"
+    stats = pool_stats["primary"]
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            wait = time.perf_counter() - start
+            self.stats["checkouts"] += 1
+            self.stats["wait_seconds"] += wait
+            self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], wait)
+
+
+class ReplicaTimedQueuePool(TimedQueuePool):
+    # recreate() создает пул того же класса, поэтому счетчики реплики не смешаются с primary
+    stats = pool_stats["replica"]
+
+
+DATABASE_CONNECT_ARGS = {"prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+
 if settings.MODE == "TEST":
     DATABASE_URL = f"postgresql+asyncpg://{settings.TEST_DB_USER}:{settings.TEST_DB_PASS}@{settings.TEST_DB_HOST}:{settings.TEST_DB_PORT}/{settings.TEST_DB_NAME}"
-    DATABASE_PARAMS = {"poolclass": NullPool}
+    DATABASE_PARAMS = {"poolclass": NullPool, "connect_args": DATABASE_CONNECT_ARGS}
+    REPLICA_DATABASE_PARAMS = DATABASE_PARAMS
 else:
     DATABASE_URL = f"postgresql+asyncpg://{settings.DB_USER}:{settings.DB_PASS}@{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
-    DATABASE_PARAMS = {}
+    DATABASE_PARAMS = {
+        "poolclass": TimedQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "connect_args": DATABASE_CONNECT_ARGS,
+    }
+    REPLICA_DATABASE_PARAMS = {**DATABASE_PARAMS, "poolclass": ReplicaTimedQueuePool}
+
+# Движки создаются лениво: при первом обращении или в lifespan приложения
+_engine = None
+_replica_engine = None
+async_session_maker = sessionmaker(class_=AsyncSession, expire_on_commit=False)
+async_replica_session_maker = sessionmaker(class_=AsyncSession, expire_on_commit=False)
+
+# Клиент недавно что-то изменял: читаем с primary, чтобы увидеть свои записи
+prefer_primary: ContextVar[bool] = ContextVar("prefer_primary", default=False)
+
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+STICKY_PRIMARY_COOKIE = "purchases_read_primary"
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        _engine = create_async_engine(DATABASE_URL, **DATABASE_PARAMS)
+        async_session_maker.configure(bind=_engine)
+    return _engine
+
+
+def get_replica_engine():
+    "Движок реплики или None, если реплика не настроена"
+    global _replica_engine
+    if _replica_engine is None and settings.DB_REPLICA_URL:
+        _replica_engine = create_async_engine(settings.DB_REPLICA_URL, **REPLICA_DATABASE_PARAMS)
+        async_replica_session_maker.configure(bind=_replica_engine)
+    return _replica_engine
+
+
+def get_session_maker(read_only: bool = False):
+    "Чтение уходит на реплику, если она есть и клиент не в окне read-your-writes"
+    if read_only and not prefer_primary.get() and get_replica_engine() is not None:
+        return async_replica_session_maker
+    get_engine()
+    return async_session_maker
+
+
+def __getattr__(name):
+    # `from app.database import engine` по-прежнему работает
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+async def warm_up_engine(connections: int) -> None:
+    "Заранее открывает соединения пула, чтобы первые запросы не платили за подключение"
+    engines = [get_engine(), get_replica_engine()]
+    engines = [engine for engine in engines if engine is not None and isinstance(engine.pool, AsyncAdaptedQueuePool)]
+    if not engines or connections <= 0:
+        return
+
+    async def ping(engine):
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(ping(engine) for engine in engines for _ in range(connections)))
+
+
+async def dispose_engine() -> None:
+    global _engine, _replica_engine
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
+    if _replica_engine is not None:
+        await _replica_engine.dispose()
+        _replica_engine = None
+
+
+def get_pool_status() -> dict[str, dict]:
+    "Состояние пулов по ролям (primary, replica); движки без QueuePool не попадают"
+    status = {}
+    for role, engine in (("primary", _engine), ("replica", _replica_engine)):
+        if engine is None or not isinstance(engine.pool, TimedQueuePool):
+            continue
+        pool = engine.pool
+        status[role] = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "checkouts": pool.stats["checkouts"],
+            "wait_seconds": pool.stats["wait_seconds"],
+            "max_wait_seconds": pool.stats["max_wait_seconds"],
+        }
+    return status
+
+
+async def get_session(request: Request):
+    """Одна сессия и одна транзакция на весь запрос (зависимость FastAPI).
+    Подключать как Depends(get_session, scope="function"): тогда коммит выполняется сразу после
+    обработчика, до отправки ответа, и клиент не получает 201/204 раньше, чем запись сохранена"""
+    # GET-запросы только читают, их можно отдать реплике
+    session_maker = get_session_maker(read_only=request.method in SAFE_METHODS)
+    async with session_maker() as session:
+        async with session.begin():
+            yield session
+
+
+@asynccontextmanager
+async def session_scope(session: AsyncSession | None = None, read_only: bool = False):
+    "Отдает переданную сессию запроса или открывает собственную транзакцию"
+    if session is not None:
+        yield session
+        return
+    async with get_session_maker(read_only)() as session:
+        async with session.begin():
+            yield session
+
+
+async def sticky_primary_middleware(request, call_next):
+    "После изменения клиент на несколько секунд читает с primary (read-your-writes)"
+    token = prefer_primary.set(STICKY_PRIMARY_COOKIE in request.cookies)
+    try:
+        response = await call_next(request)
+    finally:
+        prefer_primary.reset(token)
+
+    if settings.DB_REPLICA_URL and request.method not in SAFE_METHODS and response.status_code < 400:
+        response.set_cookie(STICKY_PRIMARY_COOKIE, "1", max_age=settings.DB_REPLICA_STICKY_SECONDS, httponly=True)
+    return response
 
-engine = create_async_engine(DATABASE_URL, **DATABASE_PARAMS)
-async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 class Base(DeclarativeBase):
     pass
-
-print(DATABASE_URL)
-print("Registered tables:", Base.metadata.tables.keys())
\ No newline at end of file
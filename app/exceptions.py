@@ -5,8 +5,8 @@ class PurchaseException(HTTPException):
     status_code = 500
     detail = ""
     
-    def __init__(self):
-        super().__init__(status_code=self.status_code, detail=self.detail)
+    def __init__(self, detail: str | None = None):
+        super().__init__(status_code=self.status_code, detail=detail or self.detail)
 
 class UserAlreadyExistsException(PurchaseException):
     status_code=status.HTTP_409_CONFLICT
@@ -39,13 +39,17 @@ class IncorrectTokenFormatException(PurchaseException):
 class UserIsNotPresentException(PurchaseException):
     status_code=status.HTTP_401_UNAUTHORIZED
 
+class PasswordHashingOverloadedError(PurchaseException):
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE
+    detail="Сервер перегружен, попробуйте позже"
+
 
 class CannotAddDataToDatabase(PurchaseException):
     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
     detail="Не удалось добавить запись"
 
 class CannotProcessCSV(PurchaseException):
-    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY
     detail="Не удалось обработать CSV файл"
 
 class CustomerNotAddedError(PurchaseException):
@@ -72,6 +76,10 @@ class PurchaseNotAddedError(PurchaseException):
     status_code=status.HTTP_403_FORBIDDEN
     detail="Не удалось добавить покупку"
 
+class InvalidCursorError(PurchaseException):
+    status_code=status.HTTP_400_BAD_REQUEST
+    detail="Некорректный курсор пагинации"
+
 class DuplicateRecordError(PurchaseException):
     status_code=status.HTTP_409_CONFLICT
     detail="Такая запись уже существует"
@@ -0,0 +1,146 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.config import settings
+from app.database import get_pool_status
+from app.users.cache import user_cache
+
+logger = logging.getLogger(__name__)
+
+# Параметр asyncpg вместе с приведением типа: $1, $1::INTEGER, $1::NUMERIC(12, 2)[], $1::TIMESTAMP WITH TIME ZONE
+PLACEHOLDER = (
+    r"\$\d+(?:::(?:TIMESTAMP|TIME)\s+WITH(?:OUT)?\s+TIME\s+ZONE"
+    r"|::\w+(?:\s*\(\s*\d+(?:\s*,\s*\d+)?\s*\))?(?:\[\])*)?"
+)
+# Одинаковая "форма" запроса: параметры и списки IN (...) любой длины схлопываются
+PLACEHOLDERS = re.compile(rf"{PLACEHOLDER}(?:\s*,\s*{PLACEHOLDER})*")
+
+
+class QueryStats:
+    "Статистика SQL в рамках одного запроса к API"
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_statement = None
+        self.shapes = Counter()
+
+    def record(self, statement: str, elapsed: float) -> None:
+        self.count += 1
+        self.total_time += elapsed
+        if elapsed > self.slowest_time:
+            self.slowest_time = elapsed
+            self.slowest_statement = statement
+
+        shape = PLACEHOLDERS.sub("?", statement)
+        self.shapes[shape] += 1
+        # Предупреждаем один раз, когда форма впервые превышает порог
+        if self.shapes[shape] == settings.SQL_N_PLUS_ONE_THRESHOLD + 1:
+            metrics["n_plus_one_warnings"] += 1
+            logger.warning(
+                "Possible N+1: statement executed more than %s times in one request: %s",
+                settings.SQL_N_PLUS_ONE_THRESHOLD, shape,
+            )
+
+    def server_timing(self) -> str:
+        return (
+            f'db;dur={self.total_time * 1000:.2f};desc="{self.count} queries", '
+            f"db-slowest;dur={self.slowest_time * 1000:.2f}"
+        )
+
+
+current_query_stats: ContextVar[QueryStats | None] = ContextVar("current_query_stats", default=None)
+
+# Накопительные счетчики процесса для /metrics
+metrics = Counter()
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    metrics["sql_statements"] += 1
+    metrics["sql_duration_seconds"] += elapsed
+
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.record(statement, elapsed)
+
+
+def instrument_engine(engine=None) -> None:
+    # Без движка слушаем класс Engine: движок создается лениво, уже после импорта приложения
+    target = engine.sync_engine if engine is not None else Engine
+    if not event.contains(target, "before_cursor_execute", before_cursor_execute):
+        event.listen(target, "before_cursor_execute", before_cursor_execute)
+        event.listen(target, "after_cursor_execute", after_cursor_execute)
+
+
+async def query_stats_middleware(request, call_next):
+    stats = QueryStats()
+    token = current_query_stats.set(stats)
+    try:
+        response = await call_next(request)
+    finally:
+        current_query_stats.reset(token)
+
+    metrics["http_requests"] += 1
+    response.headers["Server-Timing"] = stats.server_timing()
+    if stats.slowest_statement:
+        logger.debug("%s %s: slowest statement %.2f ms: %s", request.method, request.url.path,
+                     stats.slowest_time * 1000, stats.slowest_statement)
+    return response
+
+
+router_metrics = APIRouter(tags=["Метрики"])
+
+# Метрика, тип и ключ из get_pool_status()
+POOL_METRICS = [
+    ("purchases_db_pool_size", "gauge", "size"),
+    ("purchases_db_pool_checked_out", "gauge", "checked_out"),
+    ("purchases_db_pool_overflow", "gauge", "overflow"),
+    ("purchases_db_pool_checkouts_total", "counter", "checkouts"),
+    ("purchases_db_pool_wait_seconds_total", "counter", "wait_seconds"),
+    ("purchases_db_pool_max_wait_seconds", "gauge", "max_wait_seconds"),
+]
+
+
+@router_metrics.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    cache_stats = user_cache.stats()
+    lines = [
+        "# TYPE purchases_http_requests_total counter",
+        f"purchases_http_requests_total {metrics['http_requests']}",
+        "# TYPE purchases_sql_statements_total counter",
+        f"purchases_sql_statements_total {metrics['sql_statements']}",
+        "# TYPE purchases_sql_duration_seconds_total counter",
+        f"purchases_sql_duration_seconds_total {metrics['sql_duration_seconds']:.6f}",
+        "# TYPE purchases_sql_n_plus_one_warnings_total counter",
+        f"purchases_sql_n_plus_one_warnings_total {metrics['n_plus_one_warnings']}",
+        "# TYPE purchases_user_cache_hits_total counter",
+        f"purchases_user_cache_hits_total {cache_stats['hits']}",
+        "# TYPE purchases_user_cache_misses_total counter",
+        f"purchases_user_cache_misses_total {cache_stats['misses']}",
+        "# TYPE purchases_user_cache_size gauge",
+        f"purchases_user_cache_size {cache_stats['size']}",
+    ]
+
+    # Пулы primary и реплики - отдельные серии с меткой role
+    pool_status = get_pool_status()
+    for name, kind, key in POOL_METRICS if pool_status else []:
+        lines.append(f"# TYPE {name} {kind}")
+        for role, status in pool_status.items():
+            value = status[key]
+            value = f"{value:.6f}" if isinstance(value, float) else value
+            lines.append(f'{name}{{role="{role}"}} {value}')
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
@@ -0,0 +1,64 @@
+import csv
+import io
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from starlette.concurrency import run_in_threadpool
+
+from app.exceptions import CannotProcessCSV
+
+CSV_COLUMNS = ["name", "price", "shares"]
+MAX_PRICE = Decimal("99999999.99")  # Numeric(10, 2)
+
+
+def parse_row(line_no: int, row: list[str]) -> tuple:
+    "Строка CSV -> (номер строки, название, цена, id покупателей)"
+    if len(row) != len(CSV_COLUMNS):
+        raise CannotProcessCSV(f"Строка {line_no}: ожидается {len(CSV_COLUMNS)} колонки (name, price, shares)")
+    name, price, shares = (value.strip() for value in row)
+    if not name:
+        raise CannotProcessCSV(f"Строка {line_no}: пустое название товара")
+    try:
+        price = Decimal(price.replace(",", "."))
+    except InvalidOperation:
+        raise CannotProcessCSV(f"Строка {line_no}: некорректная цена {price!r}")
+    if not price.is_finite() or price <= 0 or price > MAX_PRICE or price.as_tuple().exponent < -2:
+        raise CannotProcessCSV(f"Строка {line_no}: некорректная цена {price}")
+    try:
+        # id покупателей через ";" или пробел: "5;6;7"
+        share_ids = sorted({int(value) for value in shares.replace(";", " ").split()})
+    except ValueError:
+        raise CannotProcessCSV(f"Строка {line_no}: некорректный список покупателей {shares!r}")
+    if not share_ids:
+        raise CannotProcessCSV(f"Строка {line_no}: у товара нет покупателей")
+    return line_no, name, price, share_ids
+
+
+async def read_csv_chunks(file, chunk_size: int = 5000):
+    """Читает CSV из файла порциями по chunk_size проверенных строк.
+    В памяти одновременно только одна порция, поэтому размер файла не важен"""
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        reader = csv.reader(text)
+        try:
+            header = await run_in_threadpool(next, reader, None)
+        except (UnicodeDecodeError, csv.Error):
+            raise CannotProcessCSV("Файл не похож на CSV в кодировке UTF-8")
+        if header is None or [column.strip().lower() for column in header] != CSV_COLUMNS:
+            raise CannotProcessCSV(f"Первая строка должна быть заголовком: {','.join(CSV_COLUMNS)}")
+
+        while True:
+            try:
+                rows = await run_in_threadpool(lambda: list(islice(reader, chunk_size)))
+            except (UnicodeDecodeError, csv.Error) as e:
+                raise CannotProcessCSV(f"Строка {reader.line_num}: {e}")
+            if not rows:
+                break
+            first_line = reader.line_num - len(rows) + 1
+            yield [
+                parse_row(line_no, row)
+                for line_no, row in enumerate(rows, start=first_line)
+                if any(value.strip() for value in row)  # Пустые строки пропускаем
+            ]
+    finally:
+        text.detach()  # Файл закрывает UploadFile
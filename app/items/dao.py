@@ -1,121 +1,209 @@
-from sqlalchemy import delete, insert, select
+from decimal import Decimal
 
+from sqlalchemy import (Column, Integer, MetaData, Numeric, Table, Text,
+                        delete, func, insert, literal, select, text)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.customers.balances import CustomerBalanceDAO
 from app.dao.base import BaseDAO
-from app.database import async_session_maker
-from app.exceptions import AccessDeniedError, CustomerNotInPurchaseError, ItemsNotFound
+from app.database import session_scope
+from app.exceptions import (AccessDeniedError, CustomerNotInPurchaseError,
+                            ItemsNotFound, PurchaseNotFoundError)
 from app.items.models import Items, item_shares
 from app.items.schemas import ItemCreate
 from app.purchases.dao import PurchaseDAO
 from app.purchases.models import Purchases, purchase_customers
 
+# Промежуточная таблица импорта CSV: живет до конца транзакции.
+# id товаров берутся из последовательности items заранее, чтобы связать товары с долями без RETURNING
+items_import = Table(
+    "items_import",
+    MetaData(),
+    Column("item_id", Integer, server_default=text("nextval(pg_get_serial_sequence('items', 'id'))")),
+    Column("line_no", Integer, nullable=False),
+    Column("name", Text, nullable=False),
+    Column("price", Numeric(10, 2), nullable=False),
+    Column("shares", ARRAY(Integer), nullable=False),
+    prefixes=["TEMPORARY"],
+    postgresql_on_commit="DROP",
+)
+ITEMS_IMPORT_COLUMNS = ["line_no", "name", "price", "shares"]
+
 
 class ItemDAO(BaseDAO):
     model = Items
 
 
     @classmethod
-    async def add_items_to_purchase(cls, purchase_id: int, items: ItemCreate, user_id: int):
-        async with async_session_maker() as session:
-            async with session.begin():  # Используем транзакцию
-                await cls.check_purchase(purchase_id, user_id, session)
+    async def bump_purchase_versions(cls, rows, session: AsyncSession):
+        await PurchaseDAO.bump_version(sorted({row["purchase_id"] for row in rows}), session)
 
-                added_items = []  # Список для хранения данных о добавленных элементах
-                sum = 0 
-
-                for item in items:
-                    # Вставляем элемент и возвращаем всю строку
-                    query = insert(Items).values(
-                        purchase_id=purchase_id,
-                        name=item.name,
-                        price=item.price
-                    ).returning(Items)  # Возвращаем всю строку
-                    result = await session.execute(query)
-                    added_item = result.scalars().first()  # Преобразуем результат в словарь
-                    added_item_dict = {
-                        "name": added_item.name,
-                        "purchase_id": added_item.purchase_id,
-                        "id": added_item.id,
-                        "price": added_item.price
-                    }
-                    added_items.append(added_item_dict)  # Сохраняем добавленный элемент
-                    # added_items.append(added_item)  # Сохраняем добавленный элемент
-
-                    # Добавляем связи в item_shares через bulk insert
-                    for customer_id in item.shares:
-                        # Проверка, что пользоватль участвует в покупке
-                        query = select(purchase_customers).where(
-                            purchase_customers.c.customer_id == customer_id,
-                            purchase_customers.c.purchase_id == purchase_id
-                        )
-                        result = await session.execute(query)
-                        if not result.mappings().first():
-                            raise CustomerNotInPurchaseError
-
-
-                        amount = item.price / len(item.shares)
-                        query = insert(item_shares).values({"item_id": added_item.id, "customer_id": customer_id, "amount": amount})
-                        await session.execute(query)
-
-                    sum += item.price
-                
-                # Обновляем сумму покупки
-                await PurchaseDAO.add_total_amount(purchase_id, sum)
-
-                await session.commit()
-
-                return added_items  # Возвращаем все добавленные элементы
-            
 
     @classmethod
-    async def delete_item_from_purchase(cls, item_id: int, purchase_id: int, user_id: int):
-        async with async_session_maker() as session:
-            await cls.check_purchase(purchase_id, user_id, session)
-
-            # Проверка, что item существует
-            query = select(Items.id).where(Items.id == item_id)
+    async def add_items_to_purchase(cls, purchase_id: int, items: ItemCreate, user_id: int, session: AsyncSession | None = None):
+        async with session_scope(session) as session:  # Используем транзакцию
+            # Владелец покупки и участники из shares - одним запросом
+            share_ids = {customer_id for item in items for customer_id in item.shares}
+            members = (
+                select(func.array_agg(purchase_customers.c.customer_id))
+                .where(
+                    purchase_customers.c.purchase_id == purchase_id,
+                    purchase_customers.c.customer_id.in_(list(share_ids))
+                )
+                .scalar_subquery()
+            )
+            query = select(Purchases.created_by, members.label("member_ids")).where(Purchases.id == purchase_id)
             result = await session.execute(query)
-            if not result.mappings().first():
-                raise ItemsNotFound
+            purchase = result.mappings().first()
+            if not purchase:
+                raise PurchaseNotFoundError
+            if purchase.created_by != user_id:
+                raise AccessDeniedError
+
+            if not items:
+                return []
+
+            # Проверка, что все покупатели из shares участвуют в покупке
+            if share_ids - set(purchase.member_ids or []):
+                raise CustomerNotInPurchaseError
+
+            # Вставляем все товары одним multi-row INSERT ... RETURNING (порядок строк сохраняется)
+            query = insert(Items).returning(
+                Items.id, Items.name, Items.price, Items.purchase_id,
+                sort_by_parameter_order=True
+            )
+            result = await session.execute(
+                query,
+                [{"purchase_id": purchase_id, "name": item.name, "price": item.price} for item in items]
+            )
+            added_items = [dict(row) for row in result.mappings().all()]
+
+            # Добавляем связи в item_shares одним батчем
+            shares = [
+                {"item_id": added_item["id"], "customer_id": customer_id, "amount": item.price / len(item.shares)}
+                for item, added_item in zip(items, added_items)
+                for customer_id in item.shares
+            ]
+            if shares:
+                await session.execute(insert(item_shares), shares)
+                await CustomerBalanceDAO.apply_item_shares([item["id"] for item in added_items], 1, session)
+
+            # Обновляем сумму покупки
+            await PurchaseDAO.add_total_amount(purchase_id, sum(item.price for item in items), session)
+
+            return added_items  # Возвращаем все добавленные элементы
+            
 
-            # Пересчитать total_amount
-            query = select(Items.price).where(Items.id == item_id)
+    @classmethod
+    async def import_items(cls, purchase_id: int, chunks, user_id: int, session: AsyncSession | None = None):
+        """Импорт товаров из порций строк (line_no, name, price, shares) через COPY во временную таблицу
+        и перенос в items/item_shares двумя INSERT ... SELECT; total_amount обновляется один раз"""
+        async with session_scope(session) as session:
+            query = (
+                select(Purchases.created_by, func.array_agg(purchase_customers.c.customer_id).label("member_ids"))
+                .join(purchase_customers, purchase_customers.c.purchase_id == Purchases.id, isouter=True)
+                .where(Purchases.id == purchase_id)
+                .group_by(Purchases.id)
+            )
             result = await session.execute(query)
-            price = result.scalar()
-            await PurchaseDAO.add_total_amount(purchase_id, -price)
+            purchase = result.mappings().first()
+            if not purchase:
+                raise PurchaseNotFoundError
+            if purchase.created_by != user_id:
+                raise AccessDeniedError
+            member_ids = set(purchase.member_ids) - {None}
+
+            connection = await session.connection()
+            await connection.run_sync(items_import.create)
+            raw_connection = await connection.get_raw_connection()
+
+            items_count, total_amount = 0, Decimal(0)
+            async for chunk in chunks:
+                for line_no, _, _, shares in chunk:
+                    if not member_ids.issuperset(shares):
+                        raise CustomerNotInPurchaseError(f"{CustomerNotInPurchaseError.detail} (строка {line_no})")
+                if not chunk:
+                    continue
+                await raw_connection.driver_connection.copy_records_to_table(
+                    items_import.name, records=chunk, columns=ITEMS_IMPORT_COLUMNS
+                )
+                items_count += len(chunk)
+                total_amount += sum(price for _, _, price, _ in chunk)
+
+            if not items_count:
+                return {"purchase_id": purchase_id, "items_added": 0, "total_amount": 0}
+
+            await session.execute(
+                insert(Items).from_select(
+                    ["id", "purchase_id", "name", "price"],
+                    select(items_import.c.item_id, literal(purchase_id, Integer), items_import.c.name, items_import.c.price)
+                    .order_by(items_import.c.line_no),
+                )
+            )
+            await session.execute(
+                insert(item_shares).from_select(
+                    ["item_id", "customer_id", "amount"],
+                    select(
+                        items_import.c.item_id,
+                        func.unnest(items_import.c.shares),
+                        func.round(items_import.c.price / func.cardinality(items_import.c.shares), 2),
+                    ),
+                )
+            )
+            await CustomerBalanceDAO.apply_item_shares(select(items_import.c.item_id), 1, session)
+            await PurchaseDAO.add_total_amount(purchase_id, total_amount, session)
+
+            return {"purchase_id": purchase_id, "items_added": items_count, "total_amount": float(total_amount)}
 
-            # Удаление связи в item_shares
-            query = delete(item_shares).where(item_shares.c.item_id == item_id)
-            await session.execute(query)
 
-            # Удаление элемента
-            query = delete(Items).where(Items.id == item_id)
-            await session.execute(query)
+    @classmethod
+    async def delete_item_from_purchase(cls, item_id: int, purchase_id: int, user_id: int, session: AsyncSession | None = None):
+        async with session_scope(session) as session:
+            # Доли товара уходят из журнала балансов до каскадного удаления (только если покупка своя)
+            owned_item = (
+                select(Items.id)
+                .join(Purchases, Purchases.id == Items.purchase_id)
+                .where(Items.id == item_id, Items.purchase_id == purchase_id, Purchases.created_by == user_id)
+            )
+            await CustomerBalanceDAO.apply_item_shares(owned_item, -1, session)
+
+            # Удаление элемента с возвратом цены, только если покупка принадлежит пользователю.
+            # Связи в item_shares удаляются каскадно (ON DELETE CASCADE)
+            query = (
+                delete(Items)
+                .where(
+                    Items.id == item_id,
+                    Items.purchase_id == purchase_id,
+                    Purchases.id == Items.purchase_id,
+                    Purchases.created_by == user_id
+                )
+                .returning(Items.price)
+            )
+            result = await session.execute(query)
+            price = result.scalar()
+            if price is None:
+                # Ничего не удалено: выясняем причину
+                await cls.check_purchase(purchase_id, user_id, session)
+                raise ItemsNotFound
 
-            await session.commit()
+            # Пересчитать total_amount в той же транзакции
+            await PurchaseDAO.add_total_amount(purchase_id, -price, session)
     
     @classmethod
-    async def get_item_by_id(cls, item_id: int, user_id: int):
-        async with async_session_maker() as session:
-            # Проерка, что item существует
-            query = select(Items.id).where(Items.id == item_id)
+    async def get_item_by_id(cls, item_id: int, user_id: int, session: AsyncSession | None = None):
+        async with session_scope(session, read_only=True) as session:
+            # Товар вместе с владельцем покупки одним запросом
+            query = (
+                select(Items.id, Items.name, Items.price, Items.purchase_id, Purchases.created_by)
+                .join(Purchases, Purchases.id == Items.purchase_id)
+                .where(Items.id == item_id)
+            )
             result = await session.execute(query)
-            if not result.mappings().first():
+            item = result.mappings().one_or_none()
+            if not item:
                 raise ItemsNotFound
-            
-            # Проверка, что Items принадлежит покупке, которая принадлежит пользователю
-            """
-            SELECT purchases.created_by 
-            FROM purchases
-            JOIN items ON items.purchase_id = purchases.id 
-            WHERE items.id = 7
-            """
-            query = select(Purchases.created_by).join(Items, Purchases.id == Items.purchase_id).where(Items.id == item_id)
-            result = await session.execute(query)
-            created_by = result.scalars().first()
-            if created_by != user_id:
+            if item.created_by != user_id:
                 raise AccessDeniedError
-            
-            # Возвращаем item
-            query = select(Items.id, Items.name, Items.price, Items.purchase_id).where(Items.id == item_id)
-            result = await session.execute(query)
-            return result.mappings().one_or_none()
\ No newline at end of file
+
+            return {key: item[key] for key in ("id", "name", "price", "purchase_id")}
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, ForeignKey, Integer, Numeric, Table, Text
+from sqlalchemy import (Column, ForeignKey, Index, Integer, Numeric, Table,
+                        Text)
 from sqlalchemy.orm import relationship
 
 from app.database import Base
@@ -7,7 +8,7 @@ item_shares = Table(
     "item_shares",
     Base.metadata,
     Column("customer_id", Integer, ForeignKey("customers.id", ondelete="CASCADE"), primary_key=True),
-    Column("item_id", Integer, ForeignKey("items.id", ondelete="CASCADE"), primary_key=True),
+    Column("item_id", Integer, ForeignKey("items.id", ondelete="CASCADE"), primary_key=True, index=True),
     Column("amount", Numeric(10, 2), nullable=False),
 )
 
@@ -16,9 +17,14 @@ class Items(Base):
     __tablename__ = "items"
 
     id = Column(Integer, primary_key=True, index=True)
-    purchase_id = Column(Integer, ForeignKey("purchases.id", ondelete="CASCADE"), nullable=False)
+    purchase_id = Column(Integer, ForeignKey("purchases.id", ondelete="CASCADE"), nullable=False, index=True)
     name = Column(Text, nullable=False)
     price = Column(Numeric(10, 2), nullable=False)
 
     purchase = relationship("Purchases", back_populates="items")
     customers = relationship("Customers", secondary="item_shares", back_populates="items")
+
+    __table_args__ = (
+        # Поиск по названию (pg_trgm): GiST умеет KNN-сортировку name <-> q
+        Index('ix_items_name_trgm_gist', 'name', postgresql_using='gist', postgresql_ops={'name': 'gist_trgm_ops'}),
+    )
@@ -1,6 +1,11 @@
-from fastapi import APIRouter, Depends
+from contextlib import aclosing
 
+from fastapi import APIRouter, Depends, UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_session
 from app.exceptions import ItemsNotAddedError, ItemsNotFound
+from app.items.csv_import import read_csv_chunks
 from app.items.dao import ItemDAO
 from app.items.schemas import ItemsList
 from app.users.dependencies import get_current_user
@@ -14,21 +19,51 @@ router_items = APIRouter(
 
 # POST /items/{purchase_id}
 @router_items.post("/{purchase_id}", status_code=201)
-async def add_items_to_purchase(purchase_id: int, items_list: ItemsList, user: Users = Depends(get_current_user)):
-    items = await ItemDAO.add_items_to_purchase(purchase_id=purchase_id, items=items_list.items, user_id=user.id)
+async def add_items_to_purchase(
+    purchase_id: int,
+    items_list: ItemsList,
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session, scope="function"),
+):
+    items = await ItemDAO.add_items_to_purchase(purchase_id=purchase_id, items=items_list.items, user_id=user.id, session=session)
     if not items:
         raise ItemsNotAddedError
     return items
 
 
+# POST /items/{purchase_id}/import
+@router_items.post("/{purchase_id}/import", status_code=201)
+async def import_items_from_csv(
+    purchase_id: int,
+    file: UploadFile,
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session, scope="function"),
+):
+    "CSV с колонками name,price,shares (id покупателей через ';')"
+    async with aclosing(read_csv_chunks(file.file)) as chunks:
+        result = await ItemDAO.import_items(purchase_id, chunks, user.id, session)
+    if not result["items_added"]:
+        raise ItemsNotAddedError
+    return result
+
+
 @router_items.delete("/{purchase_id}/{item_id}", status_code=204)
-async def delete_item_from_purchase(item_id: int, purchase_id: int, user: Users = Depends(get_current_user)):
-    await ItemDAO.delete_item_from_purchase(item_id=item_id, purchase_id=purchase_id, user_id=user.id)
+async def delete_item_from_purchase(
+    item_id: int,
+    purchase_id: int,
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session, scope="function"),
+):
+    await ItemDAO.delete_item_from_purchase(item_id=item_id, purchase_id=purchase_id, user_id=user.id, session=session)
 
 
 @router_items.get("/{item_id}", status_code=200)
-async def get_item_by_id(item_id: int, user: Users = Depends(get_current_user)):
-    item = await ItemDAO.get_item_by_id(item_id=item_id, user_id=user.id)
+async def get_item_by_id(
+    item_id: int,
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session, scope="function"),
+):
+    item = await ItemDAO.get_item_by_id(item_id=item_id, user_id=user.id, session=session)
     if not item:
         raise ItemsNotFound
     return item
\ No newline at end of file
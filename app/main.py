@@ -1,14 +1,38 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
+from app.config import settings
 from app.customers.router import router_customers
+from app.database import (dispose_engine, get_engine,
+                          sticky_primary_middleware, warm_up_engine)
+from app.instrumentation import (instrument_engine, query_stats_middleware,
+                                 router_metrics)
 from app.items.router import router_items
 from app.purchases.router import router_purchases
+from app.search.router import router_search
 from app.users.router import router_auth, router_users
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Пул создается и прогревается при старте, чтобы первые запросы не ждали подключения
+    get_engine()
+    await warm_up_engine(settings.DB_POOL_WARMUP)
+    yield
+    await dispose_engine()
+
+
+app = FastAPI(lifespan=lifespan)
+
+instrument_engine()
+app.middleware("http")(query_stats_middleware)
+app.middleware("http")(sticky_primary_middleware)
 
 app.include_router(router_auth)
 app.include_router(router_users)
 app.include_router(router_purchases)
 app.include_router(router_customers)
-app.include_router(router_items)
\ No newline at end of file
+app.include_router(router_items)
+app.include_router(router_search)
+app.include_router(router_metrics)
@@ -0,0 +1,40 @@
+"""add foreign key indexes
+
+Revision ID: 185245651df1
+Revises: 85a43b3335d2
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '185245651df1'
+down_revision: Union[str, None] = '85a43b3335d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# item_shares.customer_id уже покрыт первичным ключом (customer_id, item_id),
+# поиск долей по товару идет по item_id - ему и нужен отдельный индекс
+INDEXES = [
+    ('ix_items_purchase_id', 'items', ['purchase_id']),
+    ('ix_purchases_created_by', 'purchases', ['created_by']),
+    ('ix_customers_created_by', 'customers', ['created_by']),
+    ('ix_item_shares_item_id', 'item_shares', ['item_id']),
+    ('ix_purchase_customers_customer_id', 'purchase_customers', ['customer_id']),
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
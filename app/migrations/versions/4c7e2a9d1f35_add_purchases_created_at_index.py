@@ -0,0 +1,34 @@
+"""add purchases created_at index
+
+Revision ID: 4c7e2a9d1f35
+Revises: 185245651df1
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '4c7e2a9d1f35'
+down_revision: Union[str, None] = '185245651df1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_purchases_created_by_created_at', 'purchases', ['created_by', 'created_at'],
+            unique=False, postgresql_concurrently=True, if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_purchases_created_by_created_at', table_name='purchases',
+            postgresql_concurrently=True, if_exists=True,
+        )
@@ -0,0 +1,26 @@
+"""add purchases version
+
+Revision ID: 9b3d5e8a2c61
+Revises: 4c7e2a9d1f35
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '9b3d5e8a2c61'
+down_revision: Union[str, None] = '4c7e2a9d1f35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Константный DEFAULT не переписывает таблицу (PostgreSQL 11+)
+    op.add_column('purchases', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('purchases', 'version')
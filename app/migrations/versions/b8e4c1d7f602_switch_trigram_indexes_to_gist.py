@@ -0,0 +1,46 @@
+"""switch trigram indexes to gist
+
+Revision ID: b8e4c1d7f602
+Revises: e7a2b5c94d13
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8e4c1d7f602'
+down_revision: Union[str, None] = 'e7a2b5c94d13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (GIN-индекс, GiST-индекс, таблица): GIN не отдает top-k, поиск сортирует KNN по name <-> q
+INDEXES = [
+    ('ix_purchases_name_trgm', 'ix_purchases_name_trgm_gist', 'purchases'),
+    ('ix_items_name_trgm', 'ix_items_name_trgm_gist', 'items'),
+    ('ix_customers_name_trgm', 'ix_customers_name_trgm_gist', 'customers'),
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        for gin_name, gist_name, table in INDEXES:
+            # Сначала строим новый индекс, чтобы поиск не оставался без индекса
+            op.create_index(
+                gist_name, table, ['name'], unique=False, if_not_exists=True,
+                postgresql_using='gist', postgresql_ops={'name': 'gist_trgm_ops'}, postgresql_concurrently=True,
+            )
+            op.drop_index(gin_name, table_name=table, postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for gin_name, gist_name, table in reversed(INDEXES):
+            op.create_index(
+                gin_name, table, ['name'], unique=False, if_not_exists=True,
+                postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}, postgresql_concurrently=True,
+            )
+            op.drop_index(gist_name, table_name=table, postgresql_concurrently=True, if_exists=True)
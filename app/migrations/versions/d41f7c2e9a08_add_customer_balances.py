@@ -0,0 +1,36 @@
+"""add customer balances
+
+Revision ID: d41f7c2e9a08
+Revises: 9b3d5e8a2c61
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41f7c2e9a08'
+down_revision: Union[str, None] = '9b3d5e8a2c61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'customer_balances',
+        sa.Column('customer_id', sa.Integer(), nullable=False),
+        sa.Column('amount', sa.Numeric(precision=12, scale=2), server_default='0', nullable=False),
+        sa.ForeignKeyConstraint(['customer_id'], ['customers.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('customer_id'),
+    )
+    # Начальное заполнение; дальше журнал ведется в транзакциях, сверка - python -m app.customers.balances
+    op.execute(
+        "INSERT INTO customer_balances (customer_id, amount) "
+        "SELECT customer_id, sum(amount) FROM item_shares GROUP BY customer_id"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('customer_balances')
@@ -0,0 +1,41 @@
+"""add trigram search indexes
+
+Revision ID: e7a2b5c94d13
+Revises: d41f7c2e9a08
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a2b5c94d13'
+down_revision: Union[str, None] = 'd41f7c2e9a08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ('ix_purchases_name_trgm', 'purchases'),
+    ('ix_items_name_trgm', 'items'),
+    ('ix_customers_name_trgm', 'customers'),
+]
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        for name, table in INDEXES:
+            op.create_index(
+                name, table, ['name'], unique=False, if_not_exists=True,
+                postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}, postgresql_concurrently=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+    # Расширение не удаляем: им могут пользоваться и другие объекты БД
@@ -1,85 +1,425 @@
 
+from datetime import datetime
 from decimal import Decimal
 
-from sqlalchemy import and_, distinct, func, insert, select, update
+from sqlalchemy import (Integer, Text, case, func, insert, literal,
+                        literal_column, select, tuple_, update)
+from sqlalchemy.dialects.postgresql import JSONB, aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.dao.base import BaseDAO
-from app.database import async_session_maker
+from app.customers.balances import CustomerBalanceDAO
+from app.customers.models import Customers
+from app.dao.base import BaseDAO, decode_cursor, encode_cursor
+from app.database import session_scope
+from app.exceptions import (AccessDeniedCustomersError, AccessDeniedError,
+                            CustomerNotInPurchaseError, PurchaseNotFoundError)
 from app.items.models import Items, item_shares
 from app.purchases.models import Purchases, purchase_customers
-from app.purchases.schemas import PurchaseCreate
+from app.purchases.schemas import PurchaseCreate, PurchaseFullCreate
 
 
 class PurchaseDAO(BaseDAO):
     model = Purchases
+    not_found_error = PurchaseNotFoundError
 
 
     @classmethod
-    async def add(cls, purchase_data: PurchaseCreate, created_by):
-        async with async_session_maker() as session:
-            async with session.begin():  # Используем транзакцию
-                # Создаем новую покупку
-                new_purchase = Purchases(
-                    name=purchase_data.name,
-                    created_by=created_by,
-                    total_amount=0
-                )
-                session.add(new_purchase)
-                await session.flush()  # Получаем `new_purchase.id` без коммита
+    async def add(cls, purchase_data: PurchaseCreate, created_by, session: AsyncSession | None = None):
+        async with session_scope(session) as session:  # Используем транзакцию
+            # Создаем новую покупку
+            new_purchase = Purchases(
+                name=purchase_data.name,
+                created_by=created_by,
+                total_amount=0
+            )
+            session.add(new_purchase)
+            await session.flush()  # Получаем `new_purchase.id` без коммита
 
-            await session.commit()
             return new_purchase
         
 
     @classmethod
-    async def get_purchase_by_id(cls, purchase_id: int, user_id: int):
-        async with async_session_maker() as session:
-            await cls.check_purchase(purchase_id, user_id, session)
-
-            # Подзапрос для получения shares (customer_id) для каждого item
-            shares_subquery = (
-                select(distinct(item_shares.c.customer_id))
-                .where(item_shares.c.item_id == Items.id)
-                .scalar_subquery()
+    async def add_full(cls, purchase_data: PurchaseFullCreate, created_by: int, session: AsyncSession | None = None):
+        "Покупка с участниками, товарами и долями в одной транзакции; total_amount считается сразу"
+        customer_ids = list(dict.fromkeys(purchase_data.customers))  # Убираем повторы, сохраняя порядок
+        items = purchase_data.items
+        # Доли проверяются по самому запросу: база для этого не нужна
+        if {customer_id for item in items for customer_id in item.shares} - set(customer_ids):
+            raise CustomerNotInPurchaseError
+
+        async with session_scope(session) as session:
+            if customer_ids:
+                query = select(func.count()).where(Customers.id.in_(customer_ids), Customers.created_by == created_by)
+                if (await session.execute(query)).scalar() != len(customer_ids):
+                    raise AccessDeniedCustomersError
+
+            total_amount = sum((Decimal(str(item.price)) for item in items), Decimal(0))
+            query = (
+                insert(Purchases)
+                .values(name=purchase_data.name, created_by=created_by, total_amount=total_amount)
+                .returning(Purchases.id, Purchases.name, Purchases.total_amount)
             )
+            purchase = (await session.execute(query)).mappings().one()
+
+            if customer_ids:
+                await session.execute(
+                    insert(purchase_customers),
+                    [{"purchase_id": purchase.id, "customer_id": customer_id} for customer_id in customer_ids],
+                )
+
+            added_items, item_shares_ids = [], []
+            if items:
+                query = insert(Items).returning(Items.id, Items.name, Items.price, sort_by_parameter_order=True)
+                result = await session.execute(
+                    query, [{"purchase_id": purchase.id, "name": item.name, "price": item.price} for item in items]
+                )
+                added_items = [dict(row) for row in result.mappings().all()]
 
-            # Основной запрос
+                item_shares_ids = [list(dict.fromkeys(item.shares)) for item in items]
+                shares = [
+                    {"item_id": added_item["id"], "customer_id": customer_id, "amount": item.price / len(share_ids)}
+                    for item, added_item, share_ids in zip(items, added_items, item_shares_ids)
+                    for customer_id in share_ids
+                ]
+                if shares:
+                    await session.execute(insert(item_shares), shares)
+                    await CustomerBalanceDAO.apply_item_shares([item["id"] for item in added_items], 1, session)
+
+            return {
+                "id": purchase.id,
+                "purchase_name": purchase.name,
+                "total_amount": purchase.total_amount,
+                "customer_ids": customer_ids,
+                "items": [
+                    {**added_item, "shares": share_ids}
+                    for added_item, share_ids in zip(added_items, item_shares_ids)
+                ],
+            }
+
+
+    @classmethod
+    async def clone(
+        cls,
+        purchase_id: int,
+        user_id: int,
+        name: str | None = None,
+        include_items: bool = True,
+        session: AsyncSession | None = None,
+    ):
+        "Копия покупки с участниками, товарами и долями целиком внутри БД (INSERT ... SELECT)"
+        async with session_scope(session) as session:
             query = (
-                select(
-                    Purchases.id,
-                    Purchases.name.label("purchase_name"),
-                    Purchases.total_amount,
-                    func.array_agg(distinct(purchase_customers.c.customer_id)).label("customer_ids"),
-                    func.array_agg(
-                        func.jsonb_build_object(
-                            "name", Items.name,
-                            "price", Items.price,
-                            "shares", func.array(shares_subquery)
-                        ).distinct()  # Убедимся, что элементы в массиве уникальны
-                    ).label("items")
+                insert(Purchases)
+                .from_select(
+                    ["name", "created_by", "total_amount"],
+                    select(
+                        func.coalesce(literal(name, Text), Purchases.name),
+                        Purchases.created_by,
+                        Purchases.total_amount if include_items else literal(0),
+                    ).where(Purchases.id == purchase_id, Purchases.created_by == user_id),
+                )
+                .returning(Purchases.id, Purchases.name, Purchases.created_at, Purchases.total_amount)
+            )
+            new_purchase = (await session.execute(query)).mappings().first()
+            if new_purchase is None:
+                await cls.check_owner(purchase_id, user_id, session)
+            new_id = literal(new_purchase.id, Integer)
+
+            query = insert(purchase_customers).from_select(
+                ["purchase_id", "customer_id"],
+                select(new_id, purchase_customers.c.customer_id).where(purchase_customers.c.purchase_id == purchase_id),
+            )
+            await session.execute(query)
+
+            items_count = 0
+            if include_items:
+                # Новые id товаров берутся из последовательности в CTE, чтобы тем же запросом скопировать доли
+                ordered_items = (
+                    select(Items.id, Items.name, Items.price)
+                    .where(Items.purchase_id == purchase_id)
+                    .order_by(Items.id)
+                    .subquery()
+                )
+                source = select(
+                    ordered_items.c.id.label("old_id"),
+                    func.nextval(func.pg_get_serial_sequence("items", "id")).label("new_id"),
+                    ordered_items.c.name,
+                    ordered_items.c.price,
+                ).cte("source_items")
+                new_items = (
+                    insert(Items)
+                    .from_select(
+                        ["id", "purchase_id", "name", "price"],
+                        select(source.c.new_id, new_id, source.c.name, source.c.price),
+                    )
+                    .returning(Items.id)
+                    .cte("new_items")
                 )
-                .join(Items, Purchases.id == Items.purchase_id, isouter=True)  # Сначала соединяем с Items
-                .join(purchase_customers, Purchases.id == purchase_customers.c.purchase_id, isouter=True)  # LEFT JOIN
-                .where(Purchases.id == purchase_id)
-                .group_by(Purchases.id, Purchases.name)
+                query = (
+                    insert(item_shares)
+                    .from_select(
+                        ["item_id", "customer_id", "amount"],
+                        select(source.c.new_id, item_shares.c.customer_id, item_shares.c.amount)
+                        .join(source, source.c.old_id == item_shares.c.item_id),
+                    )
+                    .add_cte(new_items)
+                )
+                await session.execute(query)
+
+                query = select(func.count(Items.id)).where(Items.purchase_id == new_purchase.id)
+                items_count = (await session.execute(query)).scalar()
+                await CustomerBalanceDAO.apply_item_shares(
+                    select(Items.id).where(Items.purchase_id == new_purchase.id), 1, session
+                )
+
+            return {**new_purchase, "items_count": items_count}
+
+
+    @classmethod
+    async def get_purchase_by_id(cls, purchase_id: int, user_id: int, session: AsyncSession | None = None):
+        # Товары с долями: item_shares агрегируются по товару, без декартова произведения с покупателями
+        items_subquery = (
+            select(
+                Items.id,
+                Items.name,
+                Items.price,
+                func.array_remove(func.array_agg(item_shares.c.customer_id), None).label("shares")
+            )
+            .join(item_shares, item_shares.c.item_id == Items.id, isouter=True)
+            .where(Items.purchase_id == purchase_id)
+            .group_by(Items.id)
+            .subquery()
+        )
+        items_json = (
+            select(
+                func.coalesce(
+                    func.jsonb_agg(
+                        aggregate_order_by(
+                            func.jsonb_build_object(
+                                "id", items_subquery.c.id,
+                                "name", items_subquery.c.name,
+                                "price", items_subquery.c.price,
+                                "shares", items_subquery.c.shares,
+                            ),
+                            items_subquery.c.id
+                        ),
+                        type_=JSONB
+                    ),
+                    literal_column("'[]'::jsonb")
+                )
+            )
+            .scalar_subquery()
+        )
+        # Покупатели агрегируются отдельно от товаров
+        customer_ids = (
+            select(
+                func.coalesce(
+                    func.array_agg(aggregate_order_by(purchase_customers.c.customer_id, purchase_customers.c.customer_id)),
+                    literal_column("'{}'::integer[]")
+                )
+            )
+            .where(purchase_customers.c.purchase_id == purchase_id)
+            .scalar_subquery()
+        )
+
+        # Один запрос: владелец проверяется по created_by, агрегаты считаются только для своей покупки
+        is_owner = Purchases.created_by == user_id
+        query = (
+            select(
+                Purchases.id,
+                Purchases.created_by,
+                Purchases.name.label("purchase_name"),
+                Purchases.total_amount,
+                case((is_owner, customer_ids)).label("customer_ids"),
+                case((is_owner, items_json)).label("items"),
             )
+            .where(Purchases.id == purchase_id)
+        )
 
-            # Выполнение запроса
+        async with session_scope(session, read_only=True) as session:
             result = await session.execute(query)
-            result = result.mappings().first()
-            print(result)
-            return result
+            purchase = result.mappings().first()
+
+        if not purchase:
+            raise PurchaseNotFoundError
+        if purchase.created_by != user_id:
+            raise AccessDeniedError
+        return purchase
 
 
     @classmethod
-    async def add_total_amount(cls, purchase_id: int, total_amount: float):
-        async with async_session_maker() as session:
-            query = select(Purchases.total_amount).where(Purchases.id == purchase_id)
+    async def get_version(cls, purchase_id: int, user_id: int, session: AsyncSession | None = None) -> int:
+        "Дешевая проверка версии для условных GET: без агрегатов по товарам и участникам"
+        query = select(Purchases.created_by, Purchases.version).where(Purchases.id == purchase_id)
+        async with session_scope(session, read_only=True) as session:
             result = await session.execute(query)
-            existing_amount = result.scalar()
+            purchase = result.mappings().first()
+        if not purchase:
+            raise PurchaseNotFoundError
+        if purchase.created_by != user_id:
+            raise AccessDeniedError
+        return purchase.version
 
-            updated_amount = Decimal(existing_amount) + Decimal(total_amount)
 
-            query = update(Purchases).where(Purchases.id == purchase_id).values(total_amount=updated_amount)
+    @classmethod
+    async def bump_version(cls, purchase_ids: list[int], session: AsyncSession | None = None):
+        if not purchase_ids:
+            return
+        query = update(Purchases).where(Purchases.id.in_(purchase_ids)).values(version=Purchases.version + 1)
+        async with session_scope(session) as session:
+            await session.execute(query)
+
+
+    @classmethod
+    async def bump_purchase_versions(cls, rows, session: AsyncSession):
+        await cls.bump_version(sorted({row["id"] for row in rows}), session)
+
+
+    @classmethod
+    async def delete_owned(cls, id: int, user_id: int, session: AsyncSession | None = None):
+        async with session_scope(session) as session:
+            # Товары удалятся каскадно вместе с долями: сначала убираем их из журнала балансов
+            owned_items = (
+                select(Items.id)
+                .join(Purchases, Purchases.id == Items.purchase_id)
+                .where(Items.purchase_id == id, Purchases.created_by == user_id)
+            )
+            await CustomerBalanceDAO.apply_item_shares(owned_items, -1, session)
+            await super().delete_owned(id, user_id, session)
+
+
+    @classmethod
+    async def update_owned(cls, id: int, user_id: int, session: AsyncSession | None = None, **update_values):
+        return await super().update_owned(id, user_id, session, version=Purchases.version + 1, **update_values)
+
+
+    @classmethod
+    async def get_balances(cls, purchase_id: int, payer_id: int, user_id: int, session: AsyncSession | None = None):
+        """Чистый баланс каждого участника одним запросом: плательщик внес сумму всех долей, остальные - ничего.
+        Оплаченное считается по тем же долям, поэтому балансы в сумме дают ровно ноль"""
+        owed = (
+            select(item_shares.c.customer_id, func.sum(item_shares.c.amount).label("amount"))
+            .join(Items, Items.id == item_shares.c.item_id)
+            .where(Items.purchase_id == purchase_id)
+            .group_by(item_shares.c.customer_id)
+            .subquery()
+        )
+        owed_amount = func.coalesce(owed.c.amount, 0)
+        paid_amount = case((purchase_customers.c.customer_id == payer_id, func.sum(owed_amount).over()), else_=0)
+        query = (
+            select(purchase_customers.c.customer_id, (paid_amount - owed_amount).label("balance"))
+            .select_from(Purchases)
+            .join(purchase_customers, purchase_customers.c.purchase_id == Purchases.id)
+            .join(owed, owed.c.customer_id == purchase_customers.c.customer_id, isouter=True)
+            .where(Purchases.id == purchase_id, Purchases.created_by == user_id)
+        )
+
+        async with session_scope(session, read_only=True) as session:
+            result = await session.execute(query)
+            balances = {row.customer_id: row.balance for row in result.mappings().all()}
+            if not balances:
+                await cls.check_purchase(purchase_id, user_id, session)
+        if payer_id not in balances:
+            raise CustomerNotInPurchaseError
+        return balances
+
+
+    @classmethod
+    async def list_purchases(cls, user_id: int, limit: int = 50, cursor: str | None = None, session: AsyncSession | None = None):
+        "Покупки пользователя от новых к старым, keyset по (created_at, id), со счетчиками товаров и участников"
+        items_count = (
+            select(func.count(Items.id))
+            .where(Items.purchase_id == Purchases.id)
+            .scalar_subquery()
+        )
+        customers_count = (
+            select(func.count(purchase_customers.c.customer_id))
+            .where(purchase_customers.c.purchase_id == Purchases.id)
+            .scalar_subquery()
+        )
+        query = (
+            select(
+                Purchases.id,
+                Purchases.name,
+                Purchases.created_at,
+                Purchases.total_amount,
+                items_count.label("items_count"),
+                customers_count.label("customers_count"),
+            )
+            .where(Purchases.created_by == user_id)
+            .order_by(Purchases.created_at.desc(), Purchases.id.desc())
+            .limit(limit + 1)
+        )
+        # Страница начинается строго после последней строки предыдущей (индекс (created_by, created_at))
+        if cursor:
+            created_at, purchase_id = decode_cursor(cursor, [Purchases.created_at, Purchases.id])
+            query = query.where(tuple_(Purchases.created_at, Purchases.id) < (created_at, purchase_id))
+
+        async with session_scope(session, read_only=True) as session:
+            result = await session.execute(query)
+            purchases = result.mappings().all()
+
+        next_cursor = None
+        if len(purchases) > limit:
+            purchases = purchases[:limit]
+            next_cursor = encode_cursor([purchases[-1].created_at, purchases[-1].id])
+        return purchases, next_cursor
+
+
+    @classmethod
+    async def stream_export(
+        cls,
+        user_id: int,
+        created_from: datetime | None = None,
+        created_to: datetime | None = None,
+        batch_size: int = 1000,
+    ):
+        "Покупки пользователя с товарами и долями, по строке на долю; серверный курсор, в памяти не больше batch_size строк"
+        query = (
+            select(
+                Purchases.id.label("purchase_id"),
+                Purchases.name.label("purchase_name"),
+                Purchases.created_at,
+                Purchases.total_amount,
+                Items.id.label("item_id"),
+                Items.name.label("item_name"),
+                Items.price.label("item_price"),
+                item_shares.c.customer_id,
+                Customers.name.label("customer_name"),
+                item_shares.c.amount,
+            )
+            .select_from(Purchases)
+            .join(Items, Items.purchase_id == Purchases.id, isouter=True)
+            .join(item_shares, item_shares.c.item_id == Items.id, isouter=True)
+            .join(Customers, Customers.id == item_shares.c.customer_id, isouter=True)
+            .where(Purchases.created_by == user_id)
+            .order_by(Purchases.created_at, Purchases.id, Items.id, item_shares.c.customer_id)
+            .execution_options(yield_per=batch_size)
+        )
+        # Диапазон дат обслуживается индексом (created_by, created_at)
+        if created_from is not None:
+            query = query.where(Purchases.created_at >= created_from)
+        if created_to is not None:
+            query = query.where(Purchases.created_at < created_to)
+
+        async with session_scope(read_only=True) as session:
+            result = await session.stream(query)
+            async for partition in result.mappings().partitions():
+                for row in partition:
+                    yield row
+
+
+    @classmethod
+    async def add_total_amount(cls, purchase_id: int, total_amount: float, session: AsyncSession | None = None):
+        # Атомарный инкремент в БД: без чтения значения и без потерянных обновлений при параллельных запросах
+        query = (
+            update(Purchases)
+            .where(Purchases.id == purchase_id)
+            .values(
+                total_amount=Purchases.total_amount + Decimal(str(total_amount)),
+                version=Purchases.version + 1,
+            )
+        )
+        # Выполняем в транзакции вызывающего кода, если сессия передана
+        async with session_scope(session) as session:
             await session.execute(query)
-            await session.commit()
\ No newline at end of file
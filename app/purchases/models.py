@@ -1,4 +1,4 @@
-from sqlalchemy import (TIMESTAMP, CheckConstraint, Column, ForeignKey,
+from sqlalchemy import (TIMESTAMP, CheckConstraint, Column, ForeignKey, Index,
                         Integer, Numeric, Table, Text, UniqueConstraint, func)
 from sqlalchemy.orm import relationship
 
@@ -8,7 +8,7 @@ purchase_customers = Table(
     "purchase_customers",
     Base.metadata,
     Column("purchase_id", Integer, ForeignKey("purchases.id", ondelete="CASCADE"), primary_key=True),
-    Column("customer_id", Integer, ForeignKey("customers.id", ondelete="CASCADE"), primary_key=True),
+    Column("customer_id", Integer, ForeignKey("customers.id", ondelete="CASCADE"), primary_key=True, index=True),
     UniqueConstraint("purchase_id", "customer_id", name="uq_purchase_customer") 
 )
 
@@ -18,9 +18,11 @@ class Purchases(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(Text, nullable=False)
-    created_by = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    created_by = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
     total_amount = Column(Numeric(10, 2))
+    # Растет при каждом изменении покупки, ее товаров и участников (ETag)
+    version = Column(Integer, nullable=False, server_default="1")
 
     creator = relationship("Users", back_populates="purchases")
     customers = relationship("Customers", secondary="purchase_customers", back_populates="purchases")
@@ -28,4 +30,8 @@ class Purchases(Base):
 
     __table_args__ = (
         CheckConstraint('total_amount >= 0', name='check_total_amount_positive'),
+        # Покупки пользователя в диапазоне дат (экспорт, список по дате)
+        Index('ix_purchases_created_by_created_at', 'created_by', 'created_at'),
+        # Поиск по названию (pg_trgm): GiST умеет KNN-сортировку name <-> q
+        Index('ix_purchases_name_trgm_gist', 'name', postgresql_using='gist', postgresql_ops={'name': 'gist_trgm_ops'}),
     )
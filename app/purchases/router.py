@@ -1,10 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime, timezone
+from typing import Literal
 
-from app.exceptions import (AccessDeniedError, NoDataProvidedForUpdate,
-                            PurchaseNotAddedError, PurchaseNotFoundError,
-                            PurchaseNotUpdatedError, UserNotFound)
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_session
+from app.exceptions import PurchaseNotAddedError, PurchaseNotUpdatedError
 from app.purchases.dao import PurchaseDAO
-from app.purchases.schemas import PurchaseCreate, PurchaseUpdate
+from app.purchases.schemas import (PurchaseClone, PurchaseCreate,
+                                   PurchaseFullCreate, PurchaseRead,
+                                   PurchaseSummary, PurchaseUpdate, Settlement)
+from app.purchases.settlement import settle
+from app.responses import (csv_response, etag_matches, ndjson_response,
+                           not_modified_response, prefetch, purchase_etag)
 from app.users.dependencies import get_current_user
 from app.users.models import Users
 
@@ -15,13 +23,17 @@ router_purchases = APIRouter(
 
 
 @router_purchases.post("", status_code=201)
-async def create_new_purchase(purchase: PurchaseCreate, user: Users = Depends(get_current_user)):
+async def create_new_purchase(
+    purchase: PurchaseCreate,
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session, scope="function"),
+):
     if not purchase:
         raise ValueError("purchase is null")
     if not user:
         raise ValueError("user is null")
     try:
-        new_purchase = await PurchaseDAO.add(purchase, created_by=user.id)
+        new_purchase = await PurchaseDAO.add(purchase, created_by=user.id, session=session)
         if not new_purchase:
             raise PurchaseNotAddedError
         return new_purchase
@@ -29,20 +41,110 @@ async def create_new_purchase(purchase: PurchaseCreate, user: Users = Depends(ge
         raise e
     
 
-@router_purchases.get("/{purchase_id}")
-async def get_purchase_by_id(purchase_id: int, user: Users = Depends(get_current_user)):
-    purchase = await PurchaseDAO.get_purchase_by_id(purchase_id, user.id)
+# POST /purchases/full - покупка с участниками и товарами за один запрос
+@router_purchases.post("/full", status_code=201, response_model=PurchaseRead)
+async def create_full_purchase(
+    purchase: PurchaseFullCreate,
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session, scope="function"),
+):
+    return await PurchaseDAO.add_full(purchase, created_by=user.id, session=session)
+
+
+# GET /purchases - покупки пользователя, курсор следующей страницы в X-Next-Cursor
+@router_purchases.get("", response_model=list[PurchaseSummary])
+async def get_my_purchases(
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str | None = None,
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session, scope="function"),
+):
+    purchases, next_cursor = await PurchaseDAO.list_purchases(user.id, limit, cursor, session)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return purchases
+
+
+def to_naive_utc(value: datetime | None) -> datetime | None:
+    "created_at хранится без часового пояса (UTC): приводим к нему даты с поясом, например 2025-01-01T00:00:00Z"
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+EXPORT_COLUMNS = [
+    "purchase_id", "purchase_name", "created_at", "total_amount",
+    "item_id", "item_name", "item_price", "customer_id", "customer_name", "amount",
+]
+
+
+# GET /purchases/export?format=csv|ndjson
+@router_purchases.get("/export")
+async def export_purchases(
+    format: Literal["csv", "ndjson"] = "csv",
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+    user: Users = Depends(get_current_user),
+):
+    # Сессия запроса (scope="function") закрывается сразу после обработчика, до отправки тела,
+    # поэтому потоковая выгрузка открывает свою
+    rows = await prefetch(PurchaseDAO.stream_export(user.id, to_naive_utc(created_from), to_naive_utc(created_to)))
+    if format == "ndjson":
+        return ndjson_response(rows)
+    return csv_response(rows, EXPORT_COLUMNS, "purchases.csv")
+
+
+@router_purchases.get("/{purchase_id}", response_model=PurchaseRead)
+async def get_purchase_by_id(
+    purchase_id: int,
+    request: Request,
+    response: Response,
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session, scope="function"),
+):
+    # Сначала только версия: если у клиента актуальные данные, тяжелый запрос не нужен
+    etag = purchase_etag(purchase_id, await PurchaseDAO.get_version(purchase_id, user.id, session))
+    if etag_matches(request, etag):
+        return not_modified_response(etag)
+
+    purchase = await PurchaseDAO.get_purchase_by_id(purchase_id, user.id, session)
+    response.headers["ETag"] = etag
     return purchase
 
 
+# POST /purchases/{purchase_id}/clone - копия покупки (например, для еженедельных закупок)
+@router_purchases.post("/{purchase_id}/clone", status_code=201)
+async def clone_purchase(
+    purchase_id: int,
+    clone_data: PurchaseClone | None = None,
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session, scope="function"),
+):
+    clone_data = clone_data or PurchaseClone()
+    return await PurchaseDAO.clone(purchase_id, user.id, clone_data.name, clone_data.include_items, session)
+
+
+# GET /purchases/{purchase_id}/settlement?payer_id= - кто кому сколько переводит
+@router_purchases.get("/{purchase_id}/settlement", response_model=Settlement)
+async def get_purchase_settlement(
+    purchase_id: int,
+    payer_id: int,
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session, scope="function"),
+):
+    balances = await PurchaseDAO.get_balances(purchase_id, payer_id, user.id, session)
+    return {"purchase_id": purchase_id, "payer_id": payer_id, "transfers": settle(balances)}
+
+
 @router_purchases.delete("/{purchase_id}", status_code=204)
-async def delete_purchase_by_id(purchase_id: int, user: Users = Depends(get_current_user)):
-    purchase = await PurchaseDAO.find_one_or_none(id=purchase_id)
-    if not purchase:
-        raise PurchaseNotFoundError
-    if purchase.created_by != user.id:
-        raise AccessDeniedError
-    await PurchaseDAO.delete(id=purchase.id, created_by=user.id)
+async def delete_purchase_by_id(
+    purchase_id: int,
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session, scope="function"),
+):
+    # Удаление с фильтром по владельцу, 404/403 различаются только если строка не удалена
+    await PurchaseDAO.delete_owned(purchase_id, user.id, session)
 
 
 @router_purchases.patch("/{purchase_id}")
@@ -50,16 +152,10 @@ async def update_purchases_by_id(
     purchase_id: int,
     update_data: PurchaseUpdate,
     current_user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session, scope="function"),
 ): 
-    purchase = await PurchaseDAO.find_one_or_none(id=purchase_id)
-    if not purchase:
-        raise PurchaseNotFoundError
-    if purchase.created_by != current_user.id:
-        raise AccessDeniedError
-    
-    # Обновляем данные пользователя в базе данных
-    updated_purchase = await PurchaseDAO.update(purchase_id, created_by=current_user.id, **dict(update_data))
+    # Обновляем покупку одним UPDATE ... WHERE id AND created_by RETURNING
+    updated_purchase = await PurchaseDAO.update_owned(purchase_id, current_user.id, session, **dict(update_data))
     if not updated_purchase:
         raise PurchaseNotUpdatedError
     return updated_purchase
-
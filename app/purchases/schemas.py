@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import Dict, List
 
 from pydantic import BaseModel
@@ -16,5 +17,58 @@ class PurchaseCreate(BaseModel):
         }
     }
 
+class PurchaseFullCreate(BaseModel):
+    name: str
+    customers: List[int] = []
+    items: List[ItemCreate] = []
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "name": "Шашлыки на даче",
+                "customers": [5, 6, 7],
+                "items": [
+                    {"name": "Колбаски", "price": 100.9, "shares": [5, 6]},
+                    {"name": "Рулетик", "price": 80, "shares": [6, 7]},
+                ],
+            }
+        }
+    }
+
+class PurchaseClone(BaseModel):
+    name: str | None = None  # По умолчанию - имя исходной покупки
+    include_items: bool = True
+
 class PurchaseUpdate(BaseModel):
-    name: str
\ No newline at end of file
+    name: str
+
+class PurchaseItemRead(BaseModel):
+    id: int
+    name: str
+    price: float
+    shares: List[int]  # {customer_id}
+
+class PurchaseRead(BaseModel):
+    id: int
+    purchase_name: str
+    total_amount: float | None
+    customer_ids: List[int]
+    items: List[PurchaseItemRead]
+
+class PurchaseSummary(BaseModel):
+    id: int
+    name: str
+    created_at: datetime | None
+    total_amount: float | None
+    items_count: int
+    customers_count: int
+
+class Transfer(BaseModel):
+    from_customer_id: int
+    to_customer_id: int
+    amount: float
+
+class Settlement(BaseModel):
+    purchase_id: int
+    payer_id: int
+    transfers: List[Transfer]
@@ -0,0 +1,35 @@
+import heapq
+from decimal import Decimal
+
+
+def settle(balances: dict[int, Decimal]) -> list[dict]:
+    """Кто кому сколько переводит: жадный min-cash-flow на двух кучах.
+    Каждый шаг закрывает долг крупнейшего должника перед крупнейшим кредитором,
+    поэтому переводов не больше, чем участников с ненулевым балансом, минус один. O(n log n)"""
+    # Считаем в копейках: целые числа быстрее Decimal и не копят ошибок округления
+    creditors = []  # (-сумма, id) - куча с максимумом наверху
+    debtors = []
+    for customer_id, balance in balances.items():
+        cents = int((Decimal(balance) * 100).to_integral_value())
+        if cents > 0:
+            creditors.append((-cents, customer_id))
+        elif cents < 0:
+            debtors.append((cents, customer_id))
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+
+    transfers = []
+    while creditors and debtors:
+        credit, creditor_id = heapq.heappop(creditors)
+        debt, debtor_id = heapq.heappop(debtors)
+        amount = min(-credit, -debt)
+        transfers.append({
+            "from_customer_id": debtor_id,
+            "to_customer_id": creditor_id,
+            "amount": Decimal(amount) / 100,
+        })
+        if -credit > amount:
+            heapq.heappush(creditors, (credit + amount, creditor_id))
+        if -debt > amount:
+            heapq.heappush(debtors, (debt + amount, debtor_id))
+    return transfers
@@ -0,0 +1,71 @@
+import csv
+import io
+import json
+
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+
+
+async def prefetch(rows):
+    """Получает первую строку до создания StreamingResponse: запрос выполняется, пока статус еще не отправлен,
+    и ошибка БД превращается в обычный ответ с ошибкой, а не в оборванный 200"""
+    try:
+        first = await anext(rows)
+    except StopAsyncIteration:
+        return rows
+
+    async def chained():
+        yield first
+        async for row in rows:
+            yield row
+
+    return chained()
+
+
+async def ndjson_lines(rows):
+    async for row in rows:
+        yield json.dumps(dict(row), default=str, ensure_ascii=False) + "\n"
+
+
+def ndjson_response(rows) -> StreamingResponse:
+    "Потоковый ответ: одна JSON-строка на запись, без накопления всего результата в памяти"
+    return StreamingResponse(ndjson_lines(rows), media_type="application/x-ndjson")
+
+
+async def csv_lines(rows, columns: list[str]):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    async for row in rows:
+        writer.writerow(row[column] for column in columns)
+        # Отдаем накопленное и очищаем буфер: в памяти только текущая строка
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def csv_response(rows, columns: list[str], filename: str) -> StreamingResponse:
+    "Потоковый CSV с заголовком из columns"
+    return StreamingResponse(
+        csv_lines(rows, columns),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def purchase_etag(purchase_id: int, version: int) -> str:
+    return f'W/"purchase-{purchase_id}-v{version}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    "If-None-Match содержит текущий ETag (или *)"
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = {value.strip().removeprefix("W/") for value in if_none_match.split(",")}
+    return "*" in candidates or etag.removeprefix("W/") in candidates
+
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
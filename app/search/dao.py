@@ -0,0 +1,77 @@
+from sqlalchemy import (Float, Integer, String, cast, column, func, literal,
+                        null, or_, select, tuple_, union_all)
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.customers.models import Customers
+from app.dao.base import decode_cursor, encode_cursor
+from app.database import session_scope
+from app.items.models import Items
+from app.purchases.models import Purchases
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class SearchDAO:
+    # Ключ курсора (rank, kind, id) - типы колонок объединенного результата
+    cursor_key = [column("rank", Float), column("kind", String), column("id", Integer)]
+
+    @classmethod
+    async def search(cls, q: str, user_id: int, limit: int = 20, cursor: str | None = None, session: AsyncSession | None = None):
+        """Покупки, товары и покупатели пользователя по названию, от самых похожих; курсор - (rank, kind, id) последней строки.
+        Каждая ветка берет только limit + 1 ближайших строк KNN-обходом GiST-индекса (name <-> q):
+        GIN не умеет отдавать top-k и заставлял оценивать similarity у всех совпадений"""
+        pattern = f"%{escape_like(q)}%"
+        after = tuple(decode_cursor(cursor, cls.cursor_key)) if cursor else None
+
+        def top(query, kind, id_column, name_column):
+            similarity = func.similarity(name_column, q, type_=Float)
+            query = query.where(or_(name_column.op("%")(q), name_column.ilike(pattern, escape="\\")))
+            if after is not None:
+                query = query.where(tuple_(similarity, literal(kind, String), id_column) < after)
+            # name <-> q = 1 - similarity: порядок ветки совпадает с внешним rank DESC, id DESC
+            distance = name_column.op("<->", return_type=Float)(q)
+            return query.order_by(distance, id_column.desc()).limit(limit + 1)
+
+        def rank(name_column):
+            return func.similarity(name_column, q, type_=Float).label("rank")
+
+        purchases = top(
+            select(
+                literal("purchase", String).label("kind"), Purchases.id, Purchases.name,
+                Purchases.id.label("purchase_id"), rank(Purchases.name),
+            )
+            .where(Purchases.created_by == user_id),
+            "purchase", Purchases.id, Purchases.name,
+        )
+        items = top(
+            select(
+                literal("item", String).label("kind"), Items.id, Items.name,
+                Items.purchase_id, rank(Items.name),
+            )
+            .join(Purchases, Purchases.id == Items.purchase_id)
+            .where(Purchases.created_by == user_id),
+            "item", Items.id, Items.name,
+        )
+        customers = top(
+            select(
+                literal("customer", String).label("kind"), Customers.id, Customers.name,
+                cast(null(), Integer).label("purchase_id"), rank(Customers.name),
+            )
+            .where(Customers.created_by == user_id),
+            "customer", Customers.id, Customers.name,
+        )
+        results = union_all(purchases, items, customers).subquery()
+        key = [results.c.rank, results.c.kind, results.c.id]
+        query = select(results).order_by(*(col.desc() for col in key)).limit(limit + 1)
+
+        async with session_scope(session, read_only=True) as session:
+            result = await session.execute(query)
+            rows = result.mappings().all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([rows[-1][col.name] for col in key])
+        return rows, next_cursor
@@ -0,0 +1,31 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_session
+from app.search.dao import SearchDAO
+from app.search.schemas import SearchResult
+from app.users.dependencies import get_current_user
+from app.users.models import Users
+
+router_search = APIRouter(
+    prefix="/search",
+    tags=["Поиск"]
+)
+
+
+# GET /search?q= - курсор следующей страницы в X-Next-Cursor
+@router_search.get("", response_model=List[SearchResult])
+async def search(
+    response: Response,
+    q: str = Query(min_length=3, max_length=100),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = None,
+    user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session, scope="function"),
+):
+    results, next_cursor = await SearchDAO.search(q, user.id, limit, cursor, session)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return results
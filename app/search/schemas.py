@@ -0,0 +1,11 @@
+from typing import Literal
+
+from pydantic import BaseModel
+
+
+class SearchResult(BaseModel):
+    kind: Literal["purchase", "item", "customer"]
+    id: int
+    name: str
+    purchase_id: int | None
+    rank: float
@@ -0,0 +1,111 @@
+"""
+Бенчмарк: p99 задержки постороннего эндпоинта во время шквала логинов,
+bcrypt в event loop (как было) против bcrypt в пуле потоков.
+Второй сценарий идет на настоящем QueuePool: логин держит соединение на время bcrypt
+(как было) против короткой транзакции до проверки пароля.
+
+Запуск (файл не собирается pytest автоматически, только явно):
+    pytest app/tests/benchmarks/bench_auth.py -s
+"""
+import asyncio
+import statistics
+import time
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import database
+from app.database import (DATABASE_CONNECT_ARGS, DATABASE_URL, TimedQueuePool,
+                          async_session_maker, session_scope)
+from app.exceptions import IncorrectEmailOrPasswordException
+from app.main import app as fastapi_app
+from app.users import auth, router
+from app.users.dao import UserDAO
+
+LOGINS = 50
+PROBES = 200
+POOL_SIZE = 5
+
+
+async def blocking_run_in_hash_executor(func, *args):
+    "Прежнее поведение: bcrypt выполняется прямо в event loop"
+    return func(*args)
+
+
+async def holding_authenticate_user(email, password):
+    "Прежнее поведение: соединение из пула занято, пока bcrypt проверяет пароль"
+    async with session_scope() as session:
+        user = await UserDAO.find_one_or_none(session, email=email)
+        if not (user and await auth.verify_password(password, user.hash_password)):
+            raise IncorrectEmailOrPasswordException
+        return user
+
+
+async def login_storm(ac: AsyncClient):
+    await asyncio.gather(*(
+        ac.post("/auth/login", json={"email": "art.samohwalov@yandex.ru", "password": "wrong"})
+        for _ in range(LOGINS)
+    ))
+
+
+async def probe(ac: AsyncClient, errors: list | None = None) -> list[float]:
+    latencies = []
+    for _ in range(PROBES):
+        start = time.perf_counter()
+        response = await ac.get("/users/2")
+        latencies.append(time.perf_counter() - start)
+        if errors is not None and response.status_code != 200:
+            errors.append(response.status_code)
+        await asyncio.sleep(0)
+    return latencies
+
+
+@pytest.fixture
+async def queue_pool_engine(monkeypatch):
+    "В тестах стоит NullPool, а нехватка соединений видна только на настоящем пуле"
+    engine = create_async_engine(
+        DATABASE_URL,
+        poolclass=TimedQueuePool,
+        pool_size=POOL_SIZE,
+        max_overflow=0,
+        pool_timeout=5,
+        connect_args=DATABASE_CONNECT_ARGS,
+    )
+    previous = database.get_engine()
+    monkeypatch.setattr(database, "_engine", engine)
+    async_session_maker.configure(bind=engine)
+    try:
+        yield engine
+    finally:
+        async_session_maker.configure(bind=previous)
+        await engine.dispose()
+
+
+@pytest.mark.parametrize("mode", ["blocking", "executor"])
+async def test_bench_probe_latency_during_login_storm(mode, monkeypatch):
+    if mode == "blocking":
+        monkeypatch.setattr(auth, "run_in_hash_executor", blocking_run_in_hash_executor)
+
+    async with AsyncClient(transport=ASGITransport(app=fastapi_app), base_url="http://test") as ac:
+        _, latencies = await asyncio.gather(login_storm(ac), probe(ac))
+
+    p99 = statistics.quantiles(latencies, n=100)[98]
+    print(f"\n{mode:>8}: p50 {statistics.median(latencies) * 1000:7.1f} мс, p99 {p99 * 1000:7.1f} мс")
+
+
+@pytest.mark.parametrize("mode", ["holding", "released"])
+async def test_bench_probe_latency_with_queue_pool(mode, queue_pool_engine, monkeypatch):
+    if mode == "holding":
+        monkeypatch.setattr(router, "authenticate_user", holding_authenticate_user)
+
+    errors = []
+    transport = ASGITransport(app=fastapi_app, raise_app_exceptions=False)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        _, latencies = await asyncio.gather(login_storm(ac), probe(ac, errors))
+
+    p99 = statistics.quantiles(latencies, n=100)[98]
+    print(
+        f"\n{mode:>8}: p50 {statistics.median(latencies) * 1000:7.1f} мс, p99 {p99 * 1000:7.1f} мс, "
+        f"ошибок {len(errors)}, пул {POOL_SIZE}"
+    )
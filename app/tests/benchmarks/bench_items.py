@@ -0,0 +1,95 @@
+"""
+Бенчмарк добавления товаров в покупку: построчный путь (как было) против пакетного,
+и пропускная способность импорта CSV через COPY (строк в секунду).
+
+Запуск (файл не собирается pytest автоматически, только явно):
+    pytest app/tests/benchmarks/bench_items.py -s
+"""
+import tempfile
+import time
+
+import pytest
+from sqlalchemy import insert, select
+
+from app.customers.dao import CustomerDAO
+from app.customers.schemas import CustomerCreate
+from app.database import async_session_maker
+from app.items.csv_import import read_csv_chunks
+from app.items.dao import ItemDAO
+from app.items.models import Items, item_shares
+from app.items.schemas import ItemCreate
+from app.purchases.dao import PurchaseDAO
+from app.purchases.models import purchase_customers
+from app.purchases.schemas import PurchaseCreate
+
+USER_ID = 1
+SHARES_PER_ITEM = 6
+
+
+async def legacy_add_items_to_purchase(purchase_id: int, items: list[ItemCreate], user_id: int):
+    "Прежняя реализация: INSERT на каждый товар, SELECT + INSERT на каждую долю"
+    async with async_session_maker() as session:
+        async with session.begin():
+            await ItemDAO.check_purchase(purchase_id, user_id, session)
+            for item in items:
+                query = insert(Items).values(
+                    purchase_id=purchase_id, name=item.name, price=item.price
+                ).returning(Items)
+                added_item = (await session.execute(query)).scalars().first()
+                for customer_id in item.shares:
+                    query = select(purchase_customers).where(
+                        purchase_customers.c.customer_id == customer_id,
+                        purchase_customers.c.purchase_id == purchase_id
+                    )
+                    assert (await session.execute(query)).mappings().first()
+                    query = insert(item_shares).values(
+                        item_id=added_item.id, customer_id=customer_id, amount=item.price / len(item.shares)
+                    )
+                    await session.execute(query)
+
+
+async def prepare_purchase():
+    purchase = await PurchaseDAO.add(PurchaseCreate(name="Бенчмарк товаров"), created_by=USER_ID)
+    customer_ids = []
+    for i in range(SHARES_PER_ITEM):
+        customer = await CustomerDAO.add(CustomerCreate(name=f"Участник {i}"), created_by=USER_ID)
+        customer_ids.append(customer.id)
+    await CustomerDAO.add_customers_to_purchase(purchase.id, customer_ids, USER_ID)
+    return purchase.id, customer_ids
+
+
+@pytest.mark.parametrize("items_count", [1, 100, 1000])
+async def test_bench_add_items_to_purchase(items_count):
+    purchase_id, customer_ids = await prepare_purchase()
+    items = [ItemCreate(name=f"Товар {i}", price=123.45, shares=customer_ids) for i in range(items_count)]
+
+    start = time.perf_counter()
+    await legacy_add_items_to_purchase(purchase_id, items, USER_ID)
+    legacy = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await ItemDAO.add_items_to_purchase(purchase_id, items, USER_ID)
+    bulk = time.perf_counter() - start
+
+    print(f"\n{items_count:>5} товаров: построчно {legacy * 1000:9.1f} мс, пакетно {bulk * 1000:9.1f} мс")
+
+
+@pytest.mark.parametrize("rows_count", [1000, 10000, 100000])
+async def test_bench_import_items_csv(rows_count):
+    purchase_id, customer_ids = await prepare_purchase()
+    shares = ";".join(map(str, customer_ids))
+
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as file:
+        file.write(b"name,price,shares\n")
+        for i in range(rows_count):
+            file.write(f"Товар {i},123.45,{shares}\n".encode())
+        file.seek(0)
+
+        start = time.perf_counter()
+        async with async_session_maker() as session:
+            async with session.begin():
+                result = await ItemDAO.import_items(purchase_id, read_csv_chunks(file), USER_ID, session)
+        elapsed = time.perf_counter() - start
+
+    assert result["items_added"] == rows_count
+    print(f"\n{rows_count:>6} строк CSV: {elapsed:7.2f} с, {rows_count / elapsed:10.0f} строк/с")
@@ -0,0 +1,98 @@
+"""
+Бенчмарк чтения покупки с 500 товарами и 30 покупателями:
+JOIN с дедупликацией (как было) против одного запроса с раздельными агрегатами.
+
+Запуск (файл не собирается pytest автоматически, только явно):
+    pytest app/tests/benchmarks/bench_purchases.py -s
+"""
+import time
+
+from sqlalchemy import distinct, func, select
+
+from app.customers.dao import CustomerDAO
+from app.customers.schemas import CustomerCreate
+from app.database import async_session_maker
+from app.items.dao import ItemDAO
+from app.items.models import Items, item_shares
+from app.items.schemas import ItemCreate
+from app.purchases.dao import PurchaseDAO
+from app.purchases.models import Purchases, purchase_customers
+from app.purchases.schemas import PurchaseCreate
+
+USER_ID = 1
+ITEMS = 500
+CUSTOMERS = 30
+SHARES_PER_ITEM = 5
+RUNS = 20
+
+
+async def legacy_get_purchase_by_id(purchase_id: int, user_id: int):
+    "Прежняя реализация: отдельная проверка владельца, JOIN items x customers и подзапрос долей на товар"
+    async with async_session_maker() as session:
+        await PurchaseDAO.check_purchase(purchase_id, user_id, session)
+        shares_subquery = (
+            select(distinct(item_shares.c.customer_id))
+            .where(item_shares.c.item_id == Items.id)
+            .scalar_subquery()
+        )
+        query = (
+            select(
+                Purchases.id,
+                Purchases.name.label("purchase_name"),
+                Purchases.total_amount,
+                func.array_agg(distinct(purchase_customers.c.customer_id)).label("customer_ids"),
+                func.array_agg(
+                    func.jsonb_build_object(
+                        "name", Items.name,
+                        "price", Items.price,
+                        "shares", func.array(shares_subquery)
+                    ).distinct()
+                ).label("items")
+            )
+            .join(Items, Purchases.id == Items.purchase_id, isouter=True)
+            .join(purchase_customers, Purchases.id == purchase_customers.c.purchase_id, isouter=True)
+            .where(Purchases.id == purchase_id)
+            .group_by(Purchases.id, Purchases.name)
+        )
+        return (await session.execute(query)).mappings().first()
+
+
+async def prepare_purchase() -> int:
+    purchase = await PurchaseDAO.add(PurchaseCreate(name="Бенчмарк чтения"), created_by=USER_ID)
+    customer_ids = []
+    for i in range(CUSTOMERS):
+        customer = await CustomerDAO.add(CustomerCreate(name=f"Участник {i}"), created_by=USER_ID)
+        customer_ids.append(customer.id)
+    await CustomerDAO.add_customers_to_purchase(purchase.id, customer_ids, USER_ID)
+
+    items = [
+        ItemCreate(
+            name=f"Товар {i}",
+            price=100,
+            shares=[customer_ids[(i + j) % CUSTOMERS] for j in range(SHARES_PER_ITEM)]
+        )
+        for i in range(ITEMS)
+    ]
+    await ItemDAO.add_items_to_purchase(purchase.id, items, USER_ID)
+    return purchase.id
+
+
+async def measure(func, purchase_id: int) -> float:
+    await func(purchase_id, USER_ID)  # Прогрев
+    start = time.perf_counter()
+    for _ in range(RUNS):
+        await func(purchase_id, USER_ID)
+    return (time.perf_counter() - start) / RUNS
+
+
+async def test_bench_get_purchase_by_id():
+    purchase_id = await prepare_purchase()
+
+    legacy = await measure(legacy_get_purchase_by_id, purchase_id)
+    single = await measure(PurchaseDAO.get_purchase_by_id, purchase_id)
+
+    result = await PurchaseDAO.get_purchase_by_id(purchase_id, USER_ID)
+    assert len(result["items"]) == ITEMS
+    assert len(result["customer_ids"]) == CUSTOMERS
+
+    print(f"\n{ITEMS} товаров x {CUSTOMERS} покупателей: было {legacy * 1000:8.1f} мс, стало {single * 1000:8.1f} мс")
@@ -0,0 +1,114 @@
+"""
+Бенчмарк поиска по 1 млн товаров одного пользователя: сортировка similarity() по всем совпадениям
+(как было, с GIN) против KNN-обхода GiST-индекса name <-> q с LIMIT в каждой ветке. Цель - p95 < 20 мс.
+
+Запуск (файл не собирается pytest автоматически, только явно):
+    pytest app/tests/benchmarks/bench_search.py -s
+"""
+import statistics
+import time
+
+import pytest
+from sqlalchemy import (Float, Integer, String, cast, delete, func, literal,
+                        null, or_, select, text, union_all)
+
+from app.customers.models import Customers
+from app.database import async_session_maker
+from app.items.models import Items
+from app.purchases.dao import PurchaseDAO
+from app.purchases.models import Purchases
+from app.purchases.schemas import PurchaseCreate
+from app.search.dao import SearchDAO, escape_like
+
+USER_ID = 1
+ITEMS = 1_000_000
+RUNS = 50
+QUERIES = ["приманка", "удочка 123", "катушк", "леска 5000", "поплавок"]
+WORDS = ["Приманка", "Удочка", "Катушка", "Леска", "Поплавок", "Грузило", "Крючок", "Подсачек"]
+
+
+async def legacy_search(q: str, user_id: int, limit: int = 20):
+    "Прежняя реализация: ORDER BY similarity() по объединению всех совпадений, top-k считается после полной оценки"
+    pattern = f"%{escape_like(q)}%"
+
+    def matches(name_column):
+        return or_(name_column.op("%")(q), name_column.ilike(pattern, escape="\\"))
+
+    def rank(name_column):
+        return func.similarity(name_column, q, type_=Float).label("rank")
+
+    purchases = (
+        select(literal("purchase", String).label("kind"), Purchases.id, Purchases.name,
+               Purchases.id.label("purchase_id"), rank(Purchases.name))
+        .where(Purchases.created_by == user_id, matches(Purchases.name))
+    )
+    items = (
+        select(literal("item", String).label("kind"), Items.id, Items.name, Items.purchase_id, rank(Items.name))
+        .join(Purchases, Purchases.id == Items.purchase_id)
+        .where(Purchases.created_by == user_id, matches(Items.name))
+    )
+    customers = (
+        select(literal("customer", String).label("kind"), Customers.id, Customers.name,
+               cast(null(), Integer).label("purchase_id"), rank(Customers.name))
+        .where(Customers.created_by == user_id, matches(Customers.name))
+    )
+    results = union_all(purchases, items, customers).subquery()
+    key = [results.c.rank, results.c.kind, results.c.id]
+    query = select(results).order_by(*(col.desc() for col in key)).limit(limit + 1)
+    async with async_session_maker() as session:
+        return (await session.execute(query)).mappings().all()
+
+
+@pytest.fixture
+async def big_purchase():
+    purchase = await PurchaseDAO.add(PurchaseCreate(name="Бенчмарк поиска"), created_by=USER_ID)
+    async with async_session_maker() as session:
+        async with session.begin():
+            # Вставка одним INSERT ... SELECT: миллион строк без обмена с клиентом
+            await session.execute(
+                text(
+                    "INSERT INTO items (purchase_id, name, price) "
+                    "SELECT :purchase_id, (CAST(:words AS text[]))[1 + g % :word_count] || ' ' || g, 1 "
+                    "FROM generate_series(1, :count) AS g"
+                ),
+                {"purchase_id": purchase.id, "words": WORDS, "word_count": len(WORDS), "count": ITEMS},
+            )
+            await session.execute(text("ANALYZE items"))
+    try:
+        yield purchase.id
+    finally:
+        async with async_session_maker() as session:
+            async with session.begin():
+                await session.execute(delete(Items).where(Items.purchase_id == purchase.id))
+                await session.execute(delete(Purchases).where(Purchases.id == purchase.id))
+
+
+async def measure(search) -> list[float]:
+    for q in QUERIES:
+        await search(q, USER_ID)  # Прогрев
+    latencies = []
+    for i in range(RUNS):
+        start = time.perf_counter()
+        await search(QUERIES[i % len(QUERIES)], USER_ID)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def knn_search(q: str, user_id: int):
+    rows, _ = await SearchDAO.search(q, user_id)
+    return rows
+
+
+async def test_bench_search(big_purchase):
+    for name, search in [("similarity", legacy_search), ("knn", knn_search)]:
+        latencies = await measure(search)
+        p95 = statistics.quantiles(latencies, n=100)[94]
+        print(
+            f"\n{name:>10}: {ITEMS} товаров, p50 {statistics.median(latencies) * 1000:7.1f} мс, "
+            f"p95 {p95 * 1000:7.1f} мс (цель < 20 мс)"
+        )
+
+    # Оба пути находят одни и те же лучшие строки
+    for q in QUERIES:
+        legacy = [(row["kind"], row["id"]) for row in await legacy_search(q, USER_ID)][:20]
+        assert [(row["kind"], row["id"]) for row in await knn_search(q, USER_ID)] == legacy
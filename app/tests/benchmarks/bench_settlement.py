@@ -0,0 +1,62 @@
+"""
+Бенчмарк расчета переводов: наивный жадный алгоритм с поиском максимума перебором (O(n²))
+против жадного алгоритма на кучах (O(n log n)) на синтетических балансах.
+
+Запуск (файл не собирается pytest автоматически, только явно):
+    pytest app/tests/benchmarks/bench_settlement.py -s
+"""
+import random
+import time
+from decimal import Decimal
+
+import pytest
+
+from app.purchases.settlement import settle
+
+
+def naive_settle(balances: dict[int, Decimal]) -> list[dict]:
+    "Та же жадная стратегия, но крупнейшие кредитор и должник ищутся перебором на каждом шаге"
+    balances = {customer_id: Decimal(balance) for customer_id, balance in balances.items() if balance}
+    transfers = []
+    while balances:
+        creditor_id = max(balances, key=balances.get)
+        debtor_id = min(balances, key=balances.get)
+        amount = min(balances[creditor_id], -balances[debtor_id])
+        transfers.append({"from_customer_id": debtor_id, "to_customer_id": creditor_id, "amount": amount})
+        for customer_id, delta in ((creditor_id, -amount), (debtor_id, amount)):
+            balances[customer_id] += delta
+            if not balances[customer_id]:
+                del balances[customer_id]
+    return transfers
+
+
+def synthetic_balances(participants: int, payers: int, seed: int = 0) -> dict[int, Decimal]:
+    "Несколько плательщиков внесли все деньги поровну, остальные должны случайные суммы"
+    rng = random.Random(seed)
+    debts = [rng.randint(1, 500_000) for _ in range(participants - payers)]  # копейки
+    total = sum(debts)
+    paid = [total // payers] * payers
+    paid[0] += total - sum(paid)
+    balances = {i: Decimal(cents) / 100 for i, cents in enumerate(paid)}
+    balances.update({payers + i: -Decimal(cents) / 100 for i, cents in enumerate(debts)})
+    return balances
+
+
+@pytest.mark.parametrize("participants, payers", [(10, 2), (1000, 1), (1000, 50), (10000, 100), (10000, 5000)])
+def test_bench_settle(participants, payers):
+    balances = synthetic_balances(participants, payers)
+
+    start = time.perf_counter()
+    naive = naive_settle(balances)
+    naive_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    transfers = settle(balances)
+    heap_time = time.perf_counter() - start
+
+    assert len(transfers) <= participants - 1
+    print(
+        f"\n{participants:>6} участников, {payers:>5} плательщиков: "
+        f"перебор {naive_time * 1000:9.2f} мс ({len(naive)} переводов), "
+        f"кучи {heap_time * 1000:7.2f} мс ({len(transfers)} переводов)"
+    )
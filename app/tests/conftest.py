@@ -3,7 +3,7 @@ from datetime import datetime
 
 import pytest
 from httpx import ASGITransport, AsyncClient
-from sqlalchemy import insert
+from sqlalchemy import insert, text
 
 from app.config import settings
 from app.customers.models import Customers
@@ -22,6 +22,8 @@ async def prepare_database():
     async with engine.begin() as conn:
         # Удаление всех заданных нами таблиц из БД
         await conn.run_sync(Base.metadata.drop_all)
+        # Триграммные индексы поиска требуют расширения pg_trgm
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
         # Добавление всех заданных нами таблиц из БД
         await conn.run_sync(Base.metadata.create_all)
 
@@ -0,0 +1,43 @@
+import asyncio
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import func, select
+
+from app.customers.dao import CustomerDAO
+from app.customers.schemas import CustomerCreate
+from app.database import async_session_maker
+from app.items.dao import ItemDAO
+from app.items.models import Items
+from app.items.schemas import ItemCreate
+from app.purchases.dao import PurchaseDAO
+from app.purchases.models import Purchases
+from app.purchases.schemas import PurchaseCreate
+
+
+@pytest.mark.parametrize("adds_count, price", [(300, Decimal("12.34"))])
+async def test_parallel_add_items_total_amount(adds_count: int, price: Decimal):
+    user_id = 1
+    purchase = await PurchaseDAO.add(PurchaseCreate(name="Параллельные товары"), created_by=user_id)
+    customer = await CustomerDAO.add(CustomerCreate(name="Параллельный"), created_by=user_id)
+    await CustomerDAO.add_customers_to_purchase(purchase.id, [customer.id], user_id)
+
+    # Ограничиваем число одновременных соединений, но транзакции всё равно конкурируют за одну покупку
+    semaphore = asyncio.Semaphore(20)
+
+    async def add_item(i: int):
+        async with semaphore:
+            items = [ItemCreate(name=f"Товар {i}", price=price, shares=[customer.id])]
+            await ItemDAO.add_items_to_purchase(purchase.id, items, user_id)
+
+    await asyncio.gather(*(add_item(i) for i in range(adds_count)))
+
+    async with async_session_maker() as session:
+        query = select(Purchases.total_amount).where(Purchases.id == purchase.id)
+        total_amount = (await session.execute(query)).scalar()
+
+        query = select(func.count(Items.id), func.sum(Items.price)).where(Items.purchase_id == purchase.id)
+        items_count, items_sum = (await session.execute(query)).one()
+
+    assert items_count == adds_count
+    assert total_amount == items_sum == price * adds_count
@@ -0,0 +1,78 @@
+import json
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event, text
+
+from app.customers.dao import CustomerDAO
+from app.database import async_session_maker, engine
+from app.items.dao import ItemDAO
+from app.purchases.dao import PurchaseDAO
+
+# Таблицы, которые растут вместе с данными пользователей
+LARGE_TABLES = {"purchases", "items", "item_shares", "purchase_customers", "customers"}
+
+
+@contextmanager
+def capture_statements():
+    "Собирает SQL и параметры всех запросов, выполненных внутри блока"
+    statements = []
+
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        yield statements
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", listener)
+
+
+def find_seq_scans(plan: dict) -> list[str]:
+    relations = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in LARGE_TABLES:
+        relations.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        relations.extend(find_seq_scans(child))
+    return relations
+
+
+async def explain_dao_call(call):
+    "Выполняет вызов DAO в откатываемой транзакции и возвращает seq scan'ы по большим таблицам"
+    async with async_session_maker() as session:
+        with capture_statements() as statements:
+            await call(session)
+
+        # Без seqscan планировщик уходит в полный проход, только если подходящего индекса нет
+        await session.execute(text("SET LOCAL enable_seqscan = off"))
+        connection = await session.connection()
+        seq_scans = []
+        for statement, parameters in statements:
+            result = await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+            plan = result.scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            seq_scans.extend(find_seq_scans(plan[0]["Plan"]))
+
+        await session.rollback()  # Изменения, сделанные вызовом DAO, не сохраняем
+    return seq_scans
+
+
+@pytest.mark.parametrize(
+    "name, call",
+    [
+        ("get_purchase_by_id", lambda session: PurchaseDAO.get_purchase_by_id(2, 1, session)),
+        ("get_customers_to_purchase", lambda session: CustomerDAO.get_customers_to_purchase(2, 1, session)),
+        ("get_customers_share", lambda session: CustomerDAO.get_customers_share(2, 2, 1, session)),
+        ("get_purchase_shares", lambda session: CustomerDAO.get_purchase_shares(2, 1, session)),
+        ("get_item_by_id", lambda session: ItemDAO.get_item_by_id(1, 1, session)),
+        ("find_customers_by_owner", lambda session: CustomerDAO.find_all(session, created_by=1)),
+        ("find_purchases_by_owner", lambda session: PurchaseDAO.find_all(session, created_by=1)),
+        ("find_items_by_purchase", lambda session: ItemDAO.find_all(session, purchase_id=2)),
+        ("delete_customer_from_purchase", lambda session: CustomerDAO.delete_customer_from_purchase(1, 2, 1, session)),
+    ],
+)
+async def test_hot_path_has_no_seq_scan(name, call):
+    seq_scans = await explain_dao_call(call)
+    assert not seq_scans, f"{name}: sequential scan on {seq_scans}"
@@ -0,0 +1,74 @@
+import asyncio
+import subprocess
+import sys
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import func, select
+
+from app.customers.balances import CustomerBalanceDAO
+from app.database import async_session_maker
+from app.exceptions import AccessDeniedCustomersError, CustomerNotFound
+from app.items.dao import ItemDAO
+from app.items.models import item_shares
+from app.items.schemas import ItemCreate
+
+
+async def owed_from_shares(customer_id: int) -> Decimal:
+    async with async_session_maker() as session:
+        query = select(func.coalesce(func.sum(item_shares.c.amount), 0)).where(item_shares.c.customer_id == customer_id)
+        return (await session.execute(query)).scalar()
+
+
+async def test_balances_follow_item_changes():
+    # Тестовые данные вставлены в обход DAO: сначала сверка заполняет журнал
+    await CustomerBalanceDAO.reconcile(batch_size=3)
+    assert await CustomerBalanceDAO.reconcile(batch_size=3) == 0
+
+    balance = await CustomerBalanceDAO.get_balance(1, 1)
+    assert balance["amount"] == await owed_from_shares(1)
+
+    items = await ItemDAO.add_items_to_purchase(2, [ItemCreate(name="Удочка", price=100, shares=[1, 2])], 1)
+    assert (await CustomerBalanceDAO.get_balance(1, 1))["amount"] == balance["amount"] + 50
+
+    await ItemDAO.delete_item_from_purchase(items[0]["id"], 2, 1)
+    assert (await CustomerBalanceDAO.get_balance(1, 1))["amount"] == balance["amount"]
+
+    # Журнал совпадает с item_shares: сверке нечего исправлять
+    assert await CustomerBalanceDAO.reconcile() == 0
+
+
+async def test_reconcile_keeps_concurrent_delta():
+    await CustomerBalanceDAO.reconcile()
+
+    async with async_session_maker() as session:
+        async with session.begin():
+            # Параллельная транзакция уже изменила журнал, но еще не закоммичена
+            items = await ItemDAO.add_items_to_purchase(
+                2, [ItemCreate(name="Спиннинг", price=300, shares=[1, 2])], 1, session=session
+            )
+            reconcile = asyncio.create_task(CustomerBalanceDAO.reconcile())
+            await asyncio.sleep(0.5)
+            assert not reconcile.done()  # Сверка ждет блокировку строк журнала
+
+    await reconcile
+    assert (await CustomerBalanceDAO.get_balance(1, 1))["amount"] == await owed_from_shares(1)
+
+    await ItemDAO.delete_item_from_purchase(items[0]["id"], 2, 1)
+    assert (await CustomerBalanceDAO.get_balance(1, 1))["amount"] == await owed_from_shares(1)
+
+
+def test_reconcile_command():
+    # Как в комментарии миграции: отдельный процесс, без импорта приложения
+    result = subprocess.run([sys.executable, "-m", "app.customers.balances"], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert "Исправлено балансов" in result.stdout
+
+
+@pytest.mark.parametrize("customer_id, user_id, error", [
+    (999, 1, CustomerNotFound),
+    (5, 1, AccessDeniedCustomersError),
+])
+async def test_get_balance_errors(customer_id, user_id, error):
+    with pytest.raises(error):
+        await CustomerBalanceDAO.get_balance(customer_id, user_id)
@@ -1,3 +1,6 @@
+import base64
+import json
+
 import pytest
 from httpx import AsyncClient
 
@@ -130,4 +133,52 @@ async def test_delete_customer_from_purchase(
     expected_status: int,
 ):
     response = await authenticated_ac.delete(f"/customers/{purchase_id}/{customer_id}")
-    assert response.status_code == expected_status
\ No newline at end of file
+    assert response.status_code == expected_status
+
+async def test_get_customers_pagination(ac: AsyncClient):
+    response = await ac.get("/customers", params={"limit": 2})
+    assert response.status_code == 200
+    first_page = response.json()
+    assert len(first_page) == 2
+
+    response = await ac.get("/customers", params={"limit": 2, "cursor": response.headers["X-Next-Cursor"]})
+    assert response.status_code == 200
+    assert response.json()[0]["id"] > first_page[-1]["id"]
+
+    response = await ac.get("/customers", params={"cursor": "не курсор"})
+    assert response.status_code == 400
+
+
+async def test_stream_customers(ac: AsyncClient, authenticated_ac: AsyncClient):
+    response = await ac.get("/customers/stream")
+    assert response.status_code == 401
+
+    response = await authenticated_ac.get("/customers/stream")
+    assert response.status_code == 200
+    me = (await authenticated_ac.get("/users/me")).json()
+    customers = [json.loads(line) for line in response.text.splitlines()]
+    assert customers
+    assert all(customer["created_by"] == me["id"] for customer in customers)
+
+
+async def test_get_customers_invalid_cursor_values(ac: AsyncClient):
+    # Курсор правильной формы, но с чужими типами значений
+    for values in (["abc"], [{"a": 1}], [True], [2 ** 40]):
+        cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+        response = await ac.get("/customers", params={"cursor": cursor})
+        assert response.status_code == 400
+
+
+@pytest.mark.parametrize("purchase_id, expected_status, expected_shares", [
+    (2, 200, {1: (193.33, 1), 2: (1149.58, 3), 3: (868.59, 2)}),  # ✅ Все участники одним запросом
+    (6, 200, {}),  # ✅ Покупка без покупателей
+    (999, 404, None),  # ❌ Покупка не найдена
+    (1, 403, None),  # ❌ Нет доступа к покупке
+])
+async def test_get_purchase_shares(authenticated_ac: AsyncClient, purchase_id, expected_status, expected_shares):
+    response = await authenticated_ac.get(f"/customers/{purchase_id}/shares")
+    assert response.status_code == expected_status
+
+    if expected_status == 200:
+        shares = {row["customer_id"]: (row["amount"], row["items_count"]) for row in response.json()}
+        assert shares == expected_shares
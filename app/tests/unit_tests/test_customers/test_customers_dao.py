@@ -11,6 +11,7 @@ from app.exceptions import (AccessDeniedCustomersError, AccessDeniedError,
                             CustomerNotFound, CustomerNotInPurchaseError,
                             DuplicateRecordError, PurchaseNotFoundError)
 from app.items.models import Items, item_shares
+from app.purchases.dao import PurchaseDAO
 from app.purchases.models import purchase_customers
 
 
@@ -80,6 +81,20 @@ async def test_add_customers_to_purchase(
                 assert record["customer_id"] in customers
 
 
+async def test_add_customers_to_purchase_reports_duplicates():
+    # Покупатель 3 уже участвует в покупке 3, покупатель 2 - нет, но транзакция откатывается целиком
+    with pytest.raises(DuplicateRecordError) as exc_info:
+        await CustomerDAO.add_customers_to_purchase(3, [2, 3], 1)
+    assert "[3]" in exc_info.value.detail
+
+    async with async_session_maker() as session:
+        query = select(purchase_customers).where(
+            purchase_customers.c.purchase_id == 3,
+            purchase_customers.c.customer_id == 2
+        )
+        assert not (await session.execute(query)).first()
+
+
 @pytest.mark.parametrize(
     "purchase_id, user_id, expected_result, expect_error",
     [
@@ -217,4 +232,47 @@ async def test_delete_customer_from_purchase(
                 assert row.amount == expected_amount
 
 async def test():
-    assert 1 == 1
\ No newline at end of file
+    assert 1 == 1
+
+async def test_bulk_add_update_upsert_customers():
+    added = await CustomerDAO.add_many([
+        {"name": "Оптовый 1", "created_by": 1},
+        {"name": "Оптовый 2", "email": "bulk2@example.com", "created_by": 1},
+    ])
+    assert [customer["name"] for customer in added] == ["Оптовый 1", "Оптовый 2"]
+    first_id, second_id = (customer["id"] for customer in added)
+
+    updated = await CustomerDAO.update_many([
+        {"id": second_id, "name": "Оптовый 2*"},
+        {"id": first_id, "name": "Оптовый 1*"},
+    ])
+    assert [(customer["id"], customer["name"]) for customer in updated] == [
+        (second_id, "Оптовый 2*"), (first_id, "Оптовый 1*"),
+    ]
+    assert updated[0]["email"] == "bulk2@example.com"
+
+    upserted = await CustomerDAO.upsert(
+        [
+            {"id": first_id, "name": "Оптовый 1**", "created_by": 1},
+            {"id": first_id + 1000, "name": "Оптовый 3", "created_by": 1},
+        ],
+        update_columns=["name"],
+    )
+    assert [customer["name"] for customer in upserted] == ["Оптовый 1**", "Оптовый 3"]
+
+    skipped = await CustomerDAO.upsert([{"id": first_id, "name": "Не изменится", "created_by": 1}], update_columns=[])
+    assert skipped == []
+    customer = await CustomerDAO.find_one_or_none(id=first_id)
+    assert customer["name"] == "Оптовый 1**"
+
+    for customer_id in (first_id, second_id, first_id + 1000):
+        await CustomerDAO.delete(id=customer_id)
+
+
+async def test_generic_update_bumps_versions_of_customer_purchases():
+    # Покупатель 1 участвует в покупке 2
+    version = (await PurchaseDAO.find_one_or_none(id=2))["version"]
+    customer = await CustomerDAO.find_one_or_none(id=1)
+
+    await CustomerDAO.update_many([{"id": 1, "name": customer["name"]}])
+    assert (await PurchaseDAO.find_one_or_none(id=2))["version"] == version + 1
@@ -0,0 +1,42 @@
+from types import SimpleNamespace
+
+from fastapi import Response
+
+from app import database
+from app.config import settings
+from app.database import (async_replica_session_maker, async_session_maker,
+                          get_session_maker, prefer_primary)
+
+
+def test_without_replica_reads_go_to_primary():
+    assert settings.DB_REPLICA_URL is None
+    assert get_session_maker(read_only=True) is async_session_maker
+
+
+async def test_replica_routing_and_sticky_primary(monkeypatch):
+    # Движок создается без подключения, поэтому хватает адреса второй БД
+    monkeypatch.setattr(settings, "DB_REPLICA_URL", database.DATABASE_URL)
+    try:
+        assert get_session_maker(read_only=True) is async_replica_session_maker
+        assert get_session_maker(read_only=False) is async_session_maker
+
+        token = prefer_primary.set(True)
+        try:
+            assert get_session_maker(read_only=True) is async_session_maker
+        finally:
+            prefer_primary.reset(token)
+    finally:
+        await database._replica_engine.dispose()
+        database._replica_engine = None
+
+
+async def test_mutation_sets_sticky_primary_cookie(monkeypatch):
+    monkeypatch.setattr(settings, "DB_REPLICA_URL", database.DATABASE_URL)
+    request = SimpleNamespace(method="POST", cookies={})
+
+    async def call_next(request):
+        return Response(status_code=201)
+
+    response = await database.sticky_primary_middleware(request, call_next)
+    assert database.STICKY_PRIMARY_COOKIE in response.headers["set-cookie"]
+    assert f"Max-Age={settings.DB_REPLICA_STICKY_SECONDS}" in response.headers["set-cookie"]
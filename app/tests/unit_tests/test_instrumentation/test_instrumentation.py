@@ -0,0 +1,78 @@
+from httpx import AsyncClient
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.config import settings
+from app.database import (DATABASE_URL, ReplicaTimedQueuePool, TimedQueuePool,
+                          pool_stats)
+from app.instrumentation import QueryStats, metrics
+from app.items.models import Items
+
+
+async def test_server_timing_header(authenticated_ac: AsyncClient):
+    response = await authenticated_ac.get("/purchases/2")
+    assert response.status_code == 200
+
+    server_timing = response.headers["Server-Timing"]
+    assert server_timing.startswith("db;dur=")
+    assert "queries" in server_timing
+    assert "db-slowest;dur=" in server_timing
+
+
+async def test_metrics_endpoint(ac: AsyncClient):
+    await ac.get("/users/2")
+    response = await ac.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "purchases_sql_statements_total" in response.text
+    assert "purchases_user_cache_hits_total" in response.text
+
+
+def test_n_plus_one_detection():
+    stats = QueryStats()
+    warnings_before = metrics["n_plus_one_warnings"]
+
+    # Один и тот же запрос с разными параметрами и длиной IN-списка - одна форма
+    for i in range(settings.SQL_N_PLUS_ONE_THRESHOLD + 5):
+        stats.record("SELECT * FROM items WHERE id IN ($1, $2) AND purchase_id = $3", 0.001 * i)
+
+    assert stats.count == settings.SQL_N_PLUS_ONE_THRESHOLD + 5
+    assert len(stats.shapes) == 1
+    assert metrics["n_plus_one_warnings"] == warnings_before + 1
+
+
+def test_query_shape_ignores_asyncpg_casts():
+    stats = QueryStats()
+
+    # asyncpg рендерит параметры с приведением типа: $1::INTEGER, $2::VARCHAR
+    for ids in ([1, 2], [1, 2, 3], list(range(10))):
+        query = select(Items).where(Items.id.in_(ids), Items.name == "Удочка")
+        compiled = query.compile(dialect=postgresql.asyncpg.dialect(), compile_kwargs={"render_postcompile": True})
+        stats.record(str(compiled), 0.001)
+
+    assert "::" in str(compiled)
+    assert len(stats.shapes) == 1
+
+
+async def test_timed_pool_reports_gauges():
+    engine = create_async_engine(DATABASE_URL, poolclass=TimedQueuePool, pool_size=2, max_overflow=1)
+    replica_engine = create_async_engine(DATABASE_URL, poolclass=ReplicaTimedQueuePool, pool_size=2, max_overflow=1)
+    try:
+        checkouts_before = pool_stats["primary"]["checkouts"]
+        replica_checkouts_before = pool_stats["replica"]["checkouts"]
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+            assert engine.pool.checkedout() == 1
+        assert pool_stats["primary"]["checkouts"] == checkouts_before + 1
+        assert pool_stats["primary"]["wait_seconds"] >= 0
+
+        # Счетчики реплики отдельные, в том числе после пересоздания пула
+        assert isinstance(replica_engine.pool.recreate(), ReplicaTimedQueuePool)
+        async with replica_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        assert pool_stats["replica"]["checkouts"] == replica_checkouts_before + 1
+        assert pool_stats["primary"]["checkouts"] == checkouts_before + 1
+    finally:
+        await engine.dispose()
+        await replica_engine.dispose()
@@ -29,4 +29,27 @@ async def test_add_items_to_purchase(authenticated_ac: AsyncClient, request, pur
 ])
 async def test_delete_item_from_purchase(authenticated_ac: AsyncClient, purchase_id: int, item_id: int, expected_status):
     response = await authenticated_ac.delete(f"items/{purchase_id}/{item_id}")
-    assert response.status_code == expected_status
\ No newline at end of file
+    assert response.status_code == expected_status
+
+@pytest.mark.parametrize("purchase_id, csv_text, expected_status, expected_added", [
+    (7, "name,price,shares\nКолбаски,100.90,9;10\nРулетик,80,9\n\nСыр,\"12,5\",10\n", 201, 3),  # ✅ Успешный импорт
+    (7, "name,price,shares\n", 409, None),  # ❌ В файле нет товаров
+    (7, "name,price\nКолбаски,100\n", 422, None),  # ❌ Неверный заголовок
+    (7, "name,price,shares\nКолбаски,-5,9\n", 422, None),  # ❌ Некорректная цена
+    (7, "name,price,shares\nКолбаски,5,\n", 422, None),  # ❌ Нет покупателей
+    (7, "name,price,shares\nКолбаски,5,5;6\n", 404, None),  # ❌ Покупатели не участвуют в покупке
+    (1, "name,price,shares\nКолбаски,5,5\n", 403, None),  # ❌ Покупка не принадлежит пользователю
+])
+async def test_import_items_from_csv(authenticated_ac: AsyncClient, purchase_id, csv_text, expected_status, expected_added):
+    purchase_before = await authenticated_ac.get(f"/purchases/{purchase_id}")
+    response = await authenticated_ac.post(
+        f"/items/{purchase_id}/import",
+        files={"file": ("receipt.csv", csv_text.encode(), "text/csv")},
+    )
+    assert response.status_code == expected_status
+
+    if response.status_code == 201:
+        assert response.json()["items_added"] == expected_added
+        purchase_after = (await authenticated_ac.get(f"/purchases/{purchase_id}")).json()
+        assert len(purchase_after["items"]) == len(purchase_before.json()["items"]) + expected_added
+        assert purchase_after["total_amount"] == pytest.approx(purchase_before.json()["total_amount"] + 193.4)
@@ -8,6 +8,7 @@ from app.exceptions import AccessDeniedError, CustomerNotInPurchaseError, ItemsN
 from app.items.dao import ItemDAO
 from app.items.models import Items, item_shares
 from app.items.schemas import ItemCreate
+from app.purchases.dao import PurchaseDAO
 from app.purchases.models import Purchases
 
 
@@ -139,4 +140,13 @@ async def test_delete_item_from_purchase(
             query = select(func.sum(Items.price)).where(Items.purchase_id == purchase_id)
             result = await session.execute(query)
             total_amount = result.scalar()
-            assert total_amount == expected_total_amount # Проверяем, что total_amount равен сумме цен товаров в покупке
\ No newline at end of file
+            assert total_amount == expected_total_amount # Проверяем, что total_amount равен сумме цен товаров в покупке
+
+async def test_generic_update_bumps_purchase_version():
+    version = (await PurchaseDAO.find_one_or_none(id=2))["version"]
+
+    item = await ItemDAO.update(1, name="Пиво*")
+    assert (await PurchaseDAO.find_one_or_none(id=2))["version"] == version + 1
+
+    await ItemDAO.update_many([{"id": 1, "name": item["name"].rstrip("*")}])
+    assert (await PurchaseDAO.find_one_or_none(id=2))["version"] == version + 2
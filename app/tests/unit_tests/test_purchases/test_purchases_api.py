@@ -1,6 +1,13 @@
+import base64
+import csv
+import io
+import json
+
 import pytest
 from httpx import AsyncClient
 
+from app.responses import prefetch
+
 
 @pytest.mark.parametrize("purchase_data, expected_status", [
     ({"name": "Посидели на лавочке"}, 201),  # ✅ Успешное создание
@@ -70,4 +77,197 @@ async def test_update_purchases_by_id(
     # Проверяем тело ответа
     if expected_status == 200:
         updated_purchase = response.json()
-        assert updated_purchase["name"] == update_data["name"]
\ No newline at end of file
+        assert updated_purchase["name"] == update_data["name"]
+
+async def test_export_purchases_csv(authenticated_ac: AsyncClient):
+    response = await authenticated_ac.get("/purchases/export", params={"format": "csv"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert rows
+    assert {"purchase_id", "item_name", "customer_id", "amount"} <= set(rows[0])
+    assert "2" in {row["purchase_id"] for row in rows}
+
+
+async def test_export_purchases_ndjson_created_at_range(authenticated_ac: AsyncClient):
+    response = await authenticated_ac.get(
+        "/purchases/export",
+        params={"format": "ndjson", "created_from": "2025-01-01T00:00:00", "created_to": "2025-03-01T00:00:00"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    purchase_ids = {row["purchase_id"] for row in rows}
+    assert 2 in purchase_ids  # Рыбалка, 2025-02-17
+    assert 3 not in purchase_ids  # Поход за грибами, 2024-07-12
+    assert all("2025-01-01" <= row["created_at"] < "2025-03-01" for row in rows)
+
+
+async def test_export_purchases_aware_datetimes(authenticated_ac: AsyncClient):
+    # Даты с часовым поясом сравниваются с created_at без пояса как UTC
+    params = {"format": "ndjson", "created_from": "2025-01-01T03:00:00+03:00", "created_to": "2025-03-01T00:00:00Z"}
+    response = await authenticated_ac.get("/purchases/export", params=params)
+    assert response.status_code == 200
+
+    purchase_ids = {json.loads(line)["purchase_id"] for line in response.text.splitlines()}
+    assert 2 in purchase_ids
+    assert 3 not in purchase_ids
+
+
+async def test_prefetch_runs_query_before_response():
+    async def rows(values, error=None):
+        if error:
+            raise error
+        for value in values:
+            yield value
+
+    # Ошибка запроса всплывает в обработчике, до отправки статуса 200
+    with pytest.raises(RuntimeError):
+        await prefetch(rows([], RuntimeError("db is down")))
+
+    assert [row async for row in await prefetch(rows([1, 2, 3]))] == [1, 2, 3]
+    assert [row async for row in await prefetch(rows([]))] == []
+
+
+async def test_get_my_purchases_pagination(authenticated_ac: AsyncClient):
+    response = await authenticated_ac.get("/purchases", params={"limit": 500})
+    assert response.status_code == 200
+    all_purchases = response.json()
+    assert all_purchases
+    assert "X-Next-Cursor" not in response.headers
+
+    # Новые сверху
+    keys = [(purchase["created_at"], purchase["id"]) for purchase in all_purchases]
+    assert keys == sorted(keys, reverse=True)
+    fishing = next(purchase for purchase in all_purchases if purchase["id"] == 2)
+    assert fishing["items_count"] > 0 and fishing["customers_count"] > 0
+
+    pages, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = await authenticated_ac.get("/purchases", params=params)
+        assert response.status_code == 200
+        pages.extend(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert [purchase["id"] for purchase in pages] == [purchase["id"] for purchase in all_purchases]
+
+
+async def test_get_my_purchases_invalid_cursor_values(authenticated_ac: AsyncClient):
+    for values in (["2024-01-01T00:00:00", "abc"], [1, 2], ["2024-01-01T00:00:00+03:00", 1]):
+        cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+        response = await authenticated_ac.get("/purchases", params={"cursor": cursor})
+        assert response.status_code == 400
+
+
+async def test_get_my_purchases_not_auth(ac: AsyncClient):
+    response = await ac.get("/purchases")
+    assert response.status_code == 401
+
+
+async def test_get_purchase_etag(authenticated_ac: AsyncClient):
+    # Своя покупка: общие тестовые данные не меняем
+    response = await authenticated_ac.post("/purchases/full", json={"name": "Версии", "customers": [1]})
+    assert response.status_code == 201
+    purchase_id = response.json()["id"]
+
+    response = await authenticated_ac.get(f"/purchases/{purchase_id}")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = await authenticated_ac.get(f"/purchases/{purchase_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert not response.content
+
+    # Любое изменение покупки меняет версию
+    response = await authenticated_ac.post(
+        f"/items/{purchase_id}", json={"items": [{"name": "Червяки", "price": 10, "shares": [1]}]}
+    )
+    assert response.status_code == 201
+    response = await authenticated_ac.get(f"/purchases/{purchase_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+    response = await authenticated_ac.get(f"/customers/{purchase_id}", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+
+    response = await authenticated_ac.delete(f"/purchases/{purchase_id}")
+    assert response.status_code == 204
+
+
+@pytest.mark.parametrize("purchase_id, payer_id, expected_status", [
+    (2, 1, 200),  # ✅ Платил участник покупки
+    (2, 999, 404),  # ❌ Плательщик не участвует в покупке
+    (999, 1, 404),  # ❌ Покупка не найдена
+    (1, 5, 403),  # ❌ Покупка принадлежит другому пользователю
+])
+async def test_get_purchase_settlement(authenticated_ac: AsyncClient, purchase_id, payer_id, expected_status):
+    response = await authenticated_ac.get(f"/purchases/{purchase_id}/settlement", params={"payer_id": payer_id})
+    assert response.status_code == expected_status
+
+    if response.status_code == 200:
+        settlement = response.json()
+        assert all(transfer["to_customer_id"] == payer_id for transfer in settlement["transfers"])
+        assert payer_id not in {transfer["from_customer_id"] for transfer in settlement["transfers"]}
+
+        shares = (await authenticated_ac.get(f"/customers/{purchase_id}/shares")).json()
+        owed = {share["customer_id"]: share["amount"] for share in shares if share["customer_id"] != payer_id}
+        paid = {transfer["from_customer_id"]: transfer["amount"] for transfer in settlement["transfers"]}
+        assert paid == pytest.approx({customer_id: amount for customer_id, amount in owed.items() if amount})
+
+
+@pytest.mark.parametrize("payload, expected_status", [
+    ({"name": "Шашлыки", "customers": [1, 2, 2], "items": [
+        {"name": "Колбаски", "price": 100.9, "shares": [1, 2]},
+        {"name": "Рулетик", "price": 80, "shares": [2]},
+    ]}, 201),  # ✅ Покупка целиком
+    ({"name": "Пусто"}, 201),  # ✅ Без участников и товаров
+    ({"name": "Чужие", "customers": [1, 5], "items": []}, 403),  # ❌ Покупатель другого пользователя
+    ({"name": "Не участник", "customers": [1], "items": [{"name": "Пиво", "price": 10, "shares": [2]}]}, 404),  # ❌ Доля не участника
+])
+async def test_create_full_purchase(authenticated_ac: AsyncClient, payload, expected_status):
+    response = await authenticated_ac.post("/purchases/full", json=payload)
+    assert response.status_code == expected_status
+
+    if response.status_code == 201:
+        created = response.json()
+        stored = (await authenticated_ac.get(f"/purchases/{created['id']}")).json()
+        assert stored["purchase_name"] == payload["name"]
+        assert stored["customer_ids"] == sorted(set(payload.get("customers", [])))
+        assert stored["total_amount"] == pytest.approx(sum(item["price"] for item in payload.get("items", [])))
+        assert [(item["name"], sorted(item["shares"])) for item in stored["items"]] == [
+            (item["name"], sorted(item["shares"])) for item in payload.get("items", [])
+        ]
+
+
+@pytest.mark.parametrize("purchase_id, clone_data, expected_status", [
+    (2, None, 201),  # ✅ Полная копия
+    (2, {"name": "Рыбалка без товаров", "include_items": False}, 201),  # ✅ Только участники
+    (999, None, 404),  # ❌ Покупка не найдена
+    (1, None, 403),  # ❌ Покупка принадлежит другому пользователю
+])
+async def test_clone_purchase(authenticated_ac: AsyncClient, purchase_id, clone_data, expected_status):
+    response = await authenticated_ac.post(f"/purchases/{purchase_id}/clone", json=clone_data)
+    assert response.status_code == expected_status
+
+    if response.status_code == 201:
+        clone_id = response.json()["id"]
+        source = (await authenticated_ac.get(f"/purchases/{purchase_id}")).json()
+        clone = (await authenticated_ac.get(f"/purchases/{clone_id}")).json()
+        include_items = (clone_data or {}).get("include_items", True)
+
+        assert clone_id != purchase_id
+        assert clone["purchase_name"] == (clone_data or {}).get("name", source["purchase_name"])
+        assert clone["customer_ids"] == source["customer_ids"]
+        if include_items:
+            assert clone["total_amount"] == source["total_amount"]
+            assert [(i["name"], i["price"], sorted(i["shares"])) for i in clone["items"]] == [
+                (i["name"], i["price"], sorted(i["shares"])) for i in source["items"]
+            ]
+        else:
+            assert clone["total_amount"] == 0
+            assert clone["items"] == []
@@ -51,6 +51,7 @@ async def test_add_purchase():
              {"name": "Сигареты", "price": 322.99, "shares": {5, 6}}
         ]
         ),  # Второй случай
+        (6, 1, "Покупка без покупателей", set(), []),  # Пустая покупка: пустые списки вместо NULL
     ],
 )
 async def test_get_purchase_by_id(purchase_id, user_id, purchase_name, customer_ids, expected_items):
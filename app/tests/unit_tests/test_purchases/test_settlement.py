@@ -0,0 +1,38 @@
+import random
+from collections import defaultdict
+from decimal import Decimal
+
+import pytest
+
+from app.purchases.settlement import settle
+
+
+def apply_transfers(balances: dict, transfers: list[dict]) -> dict:
+    result = defaultdict(Decimal, balances)
+    for transfer in transfers:
+        result[transfer["from_customer_id"]] += transfer["amount"]
+        result[transfer["to_customer_id"]] -= transfer["amount"]
+    return result
+
+
+@pytest.mark.parametrize("balances, expected_transfers", [
+    ({}, []),
+    ({1: Decimal("0"), 2: Decimal("0")}, []),
+    ({1: Decimal("100"), 2: Decimal("-60"), 3: Decimal("-40")}, [(2, 1, Decimal("60")), (3, 1, Decimal("40"))]),
+    ({1: Decimal("50"), 2: Decimal("30"), 3: Decimal("-80")}, [(3, 1, Decimal("50")), (3, 2, Decimal("30"))]),
+])
+def test_settle(balances, expected_transfers):
+    transfers = settle(balances)
+    assert [(t["from_customer_id"], t["to_customer_id"], t["amount"]) for t in transfers] == expected_transfers
+
+
+def test_settle_random_balances_zero_out():
+    rng = random.Random(42)
+    balances = {i: Decimal(rng.randint(-100_000, 100_000)) / 100 for i in range(1, 1000)}
+    balances[1000] = -sum(balances.values())
+
+    transfers = settle(balances)
+
+    assert all(balance == 0 for balance in apply_transfers(balances, transfers).values())
+    assert len(transfers) <= sum(1 for balance in balances.values() if balance) - 1
+    assert all(transfer["amount"] > 0 for transfer in transfers)
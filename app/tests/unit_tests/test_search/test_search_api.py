@@ -0,0 +1,62 @@
+import pytest
+from httpx import AsyncClient
+
+
+@pytest.mark.parametrize("q, expected_kind, expected_id", [
+    ("Рыбалка", "purchase", 2),  # ✅ Своя покупка
+    ("рыбалк", "purchase", 2),  # ✅ Без учета регистра, по части слова
+    ("Кристина", "customer", 2),  # ✅ Свой покупатель
+])
+async def test_search(authenticated_ac: AsyncClient, q, expected_kind, expected_id):
+    response = await authenticated_ac.get("/search", params={"q": q})
+    assert response.status_code == 200
+    results = response.json()
+    assert (expected_kind, expected_id) in {(result["kind"], result["id"]) for result in results}
+
+    ranks = [result["rank"] for result in results]
+    assert ranks == sorted(ranks, reverse=True)
+
+
+@pytest.mark.parametrize("q, expected_status", [
+    ("Бухич в бане", 200),  # Чужая покупка не находится
+    ("Ильюха", 200),  # Чужой покупатель не находится
+    ("%%%", 200),  # Спецсимволы LIKE экранируются
+    ("ab", 422),  # ❌ Слишком короткий запрос
+])
+async def test_search_foreign_and_invalid(authenticated_ac: AsyncClient, q, expected_status):
+    response = await authenticated_ac.get("/search", params={"q": q})
+    assert response.status_code == expected_status
+    if response.status_code == 200:
+        assert response.json() == []
+
+
+async def test_search_pagination(authenticated_ac: AsyncClient):
+    # Товары в отдельной покупке: общие тестовые данные не меняем
+    items = [{"name": f"Поисковая приманка {i}", "price": 1, "shares": [1]} for i in range(5)]
+    response = await authenticated_ac.post("/purchases/full", json={"name": "Поиск", "customers": [1], "items": items})
+    assert response.status_code == 201
+    purchase_id = response.json()["id"]
+
+    response = await authenticated_ac.get("/search", params={"q": "приманка", "limit": 100})
+    assert response.status_code == 200
+    all_results = response.json()
+    assert len(all_results) >= 5
+
+    pages, cursor = [], None
+    while True:
+        params = {"q": "приманка", "limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = await authenticated_ac.get("/search", params=params)
+        assert response.status_code == 200
+        pages.extend(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert [(r["kind"], r["id"]) for r in pages] == [(r["kind"], r["id"]) for r in all_results]
+
+    response = await authenticated_ac.delete(f"/purchases/{purchase_id}")
+    assert response.status_code == 204
+
+
+async def test_search_not_auth(ac: AsyncClient):
+    response = await ac.get("/search", params={"q": "Рыбалка"})
+    assert response.status_code == 401
@@ -1,3 +1,5 @@
+import json
+
 import pytest
 from httpx import ASGITransport, AsyncClient
 
@@ -156,3 +158,14 @@ async def test_update_users_me(authenticated_ac: AsyncClient, update_data: dict,
         assert updated_user[expected_response_key] == update_data[expected_response_key]
     else:
         assert response.json()[expected_response_key] == NoDataProvidedForUpdate.detail
+
+
+async def test_stream_users(ac: AsyncClient, authenticated_ac: AsyncClient):
+    response = await ac.get("/users/stream")
+    assert response.status_code == 401
+
+    response = await authenticated_ac.get("/users/stream")
+    assert response.status_code == 200
+    users = [json.loads(line) for line in response.text.splitlines()]
+    assert users
+    assert all(set(user) == {"id", "name", "email"} for user in users)
@@ -0,0 +1,45 @@
+import pytest
+from httpx import AsyncClient
+
+from app.users.cache import UserCache
+
+
+def test_user_cache_lru_eviction():
+    cache = UserCache(maxsize=2, ttl=60)
+    cache.set(1, "первый")
+    cache.set(2, "второй")
+    assert cache.get(1) == "первый"  # 1 становится самым свежим
+    cache.set(3, "третий")  # Вытесняется 2
+
+    assert cache.get(2) is None
+    assert cache.get(1) == "первый"
+    assert cache.get(3) == "третий"
+    assert cache.stats()["size"] == 2
+
+
+def test_user_cache_ttl_and_counters():
+    cache = UserCache(maxsize=10, ttl=-1)  # Записи сразу устаревают
+    cache.set(1, "первый")
+
+    assert cache.get(1) is None
+    assert cache.stats()["hits"] == 0
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["size"] == 0
+
+
+@pytest.mark.parametrize("new_name", ["Закэшированный"])
+async def test_update_users_me_invalidates_cache(authenticated_ac: AsyncClient, new_name: str):
+    response = await authenticated_ac.get("/users/me")
+    assert response.status_code == 200
+
+    response = await authenticated_ac.patch("/users/me", json={"name": new_name})
+    assert response.status_code == 200
+
+    response = await authenticated_ac.get("/users/me")
+    assert response.json()["name"] == new_name
+
+    # Счетчики кэша отдаются только через /metrics
+    response = await authenticated_ac.get("/users/cache-stats")
+    assert response.status_code != 200
+    response = await authenticated_ac.get("/metrics")
+    assert "purchases_user_cache_misses_total" in response.text
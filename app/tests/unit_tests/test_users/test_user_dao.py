@@ -14,4 +14,23 @@ async def test_find_user_by_id(email, is_present):
         assert user
         assert user["email"] == email
     else:
-        assert not user
\ No newline at end of file
+        assert not user
+
+@pytest.mark.parametrize("limit", [1, 2, 1000])
+async def test_find_page_walks_all_users(limit):
+    all_ids = [user["id"] for user in await UserDAO.find_all()]
+
+    seen_ids, cursor = [], None
+    while True:
+        users, cursor = await UserDAO.find_page(limit, cursor)
+        assert len(users) <= limit
+        seen_ids.extend(user["id"] for user in users)
+        if not cursor:
+            break
+
+    assert seen_ids == sorted(all_ids)
+
+
+async def test_stream_all_users():
+    streamed = [user["id"] async for user in UserDAO.stream_all(batch_size=2)]
+    assert streamed == sorted(user["id"] for user in await UserDAO.find_all())
@@ -1,3 +1,5 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 from jose import jwt
@@ -5,17 +7,35 @@ from passlib.context import CryptContext
 from pydantic import EmailStr
 
 from app.config import settings
-from app.exceptions import IncorrectEmailOrPasswordException
+from app.database import session_scope
+from app.exceptions import (IncorrectEmailOrPasswordException,
+                            PasswordHashingOverloadedError)
 from app.users.dao import UserDAO
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-def get_password_hash(password: str) -> str:  
-    return pwd_context.hash(password)
+# bcrypt отпускает GIL, поэтому хватает пула потоков: event loop не блокируется на 100-300 мс
+hash_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+hash_pending = 0  # Задачи в работе и в очереди пула
 
 
-def verify_password(plain_password, hashed_password) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def run_in_hash_executor(func, *args):
+    global hash_pending
+    if hash_pending >= settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE_LIMIT:
+        raise PasswordHashingOverloadedError
+    hash_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(hash_executor, func, *args)
+    finally:
+        hash_pending -= 1
+
+
+async def get_password_hash(password: str) -> str:  
+    return await run_in_hash_executor(pwd_context.hash, password)
+
+
+async def verify_password(plain_password, hashed_password) -> bool:
+    return await run_in_hash_executor(pwd_context.verify, plain_password, hashed_password)
 
 
 def create_access_token(data: dict) -> str:
@@ -29,7 +49,10 @@ def create_access_token(data: dict) -> str:
 
 
 async def authenticate_user(email: EmailStr, password: str):
-    user = await UserDAO.find_one_or_none(email=email)
-    if not (user and verify_password(password, user.hash_password)):
+    # Своя короткая транзакция на primary: соединение возвращается в пул до bcrypt,
+    # а не держится все 100-300 мс проверки пароля
+    async with session_scope() as session:
+        user = await UserDAO.find_one_or_none(session, email=email)
+    if not (user and await verify_password(password, user.hash_password)):
         raise IncorrectEmailOrPasswordException
     return user
\ No newline at end of file
@@ -0,0 +1,52 @@
+import time
+from collections import OrderedDict
+
+from app.config import settings
+
+
+class UserCache:
+    "In-process TTL + LRU кэш строк пользователей по id"
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[int, tuple[float, object]] = OrderedDict()
+
+    def get(self, user_id: int):
+        entry = self._data.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._data[user_id]  # Запись устарела
+            self.misses += 1
+            return None
+        self._data.move_to_end(user_id)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, user_id: int, user) -> None:
+        if self.maxsize <= 0:
+            return
+        self._data[user_id] = (time.monotonic() + self.ttl, user)
+        self._data.move_to_end(user_id)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)  # Вытесняем самую давнюю запись
+
+    def invalidate(self, user_id: int | None = None) -> None:
+        if user_id is None:
+            self._data.clear()
+        else:
+            self._data.pop(user_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+        }
+
+
+user_cache = UserCache(maxsize=settings.USER_CACHE_MAXSIZE, ttl=settings.USER_CACHE_TTL)
@@ -1,6 +1,33 @@
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
 from app.dao.base import BaseDAO
+from app.database import session_scope
+from app.users.cache import user_cache
 from app.users.models import Users
 
 
+def invalidate_after_commit(session: AsyncSession, user_id: int | None) -> None:
+    "Сбрасывает запись сразу и еще раз после коммита: между ними чтение могло закэшировать старую строку"
+    user_cache.invalidate(user_id)
+    event.listen(session.sync_session, "after_commit", lambda _: user_cache.invalidate(user_id), once=True)
+
+
 class UserDAO(BaseDAO):
-    model = Users
\ No newline at end of file
+    model = Users
+
+
+    @classmethod
+    async def update(cls, id: int, session: AsyncSession | None = None, **update_values):
+        async with session_scope(session) as session:
+            updated_user = await super().update(id, session, **update_values)
+            invalidate_after_commit(session, id)
+            return updated_user
+
+
+    @classmethod
+    async def delete(cls, session: AsyncSession | None = None, **filter_by):
+        async with session_scope(session) as session:
+            await super().delete(session, **filter_by)
+            # Без id не знаем, какие записи затронуты, поэтому сбрасываем весь кэш
+            invalidate_after_commit(session, filter_by.get("id"))
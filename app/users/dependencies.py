@@ -1,9 +1,12 @@
 from fastapi import Depends, Request
 from jose import JWTError, jwt
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
+from app.database import get_session
 from app.exceptions import (IncorrectTokenFormatException,
                             TokenAbsentException, UserIsNotPresentException)
+from app.users.cache import user_cache
 from app.users.dao import UserDAO
 
 
@@ -14,7 +17,7 @@ def get_token(request: Request):
     return token
 
 
-async def get_current_user(token: str = Depends(get_token)):
+async def get_current_user(token: str = Depends(get_token), session: AsyncSession = Depends(get_session, scope="function")):
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, settings.ALGORITHM
@@ -24,8 +27,11 @@ async def get_current_user(token: str = Depends(get_token)):
     user_id: str = payload.get("sub")
     if not user_id:
         raise UserIsNotPresentException
-    user = await UserDAO.find_one_or_none(id=int(user_id))
-    if not user:
-        raise UserIsNotPresentException
+    user = user_cache.get(int(user_id))
+    if user is None:
+        user = await UserDAO.find_one_or_none(session, id=int(user_id))
+        if not user:
+            raise UserIsNotPresentException
+        user_cache.set(int(user_id), user)
 
     return user
\ No newline at end of file
@@ -1,13 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.database import get_session, session_scope
 from app.exceptions import (CannotAddDataToDatabase, NoDataProvidedForUpdate,
                             UserNotFound)
+from app.responses import ndjson_response, prefetch
 from app.users.auth import (authenticate_user, create_access_token,
                             get_password_hash)
 from app.users.dao import UserDAO
 from app.users.dependencies import get_current_user
 from app.users.models import Users
-from app.users.schemas import SUserAuth, SUserRegister, UserUpdate
+from app.users.schemas import (SUserAuth, SUserRead, SUserRegister,
+                               UserUpdate)
 
 router_auth = APIRouter(
     prefix="/auth",
@@ -23,11 +27,12 @@ router_users = APIRouter(
 @router_auth.post("/register")
 async def register_user(user_data: SUserRegister):
     #проверка, что пользователя не существует
-    existng_user = await UserDAO.find_one_or_none(email=user_data.email)
+    # Проверка и вставка идут в отдельных коротких транзакциях: пока считается bcrypt, соединение свободно
+    async with session_scope() as session:
+        existng_user = await UserDAO.find_one_or_none(session, email=user_data.email)
     if existng_user:
         raise HTTPException(status_code=500)
-    hashed_password = get_password_hash(user_data.password)
-    print(f"{user_data.name=}\n{user_data.email=}\n{hashed_password=}")
+    hashed_password = await get_password_hash(user_data.password)
     new_user = await UserDAO.add(name=user_data.name, email=user_data.email, hash_password=hashed_password)
     if not new_user:
         raise CannotAddDataToDatabase
@@ -52,43 +57,61 @@ async def read_users_me(current_user: Users = Depends(get_current_user)):
     return current_user
 
 
+async def public_users(rows):
+    async for row in rows:
+        yield SUserRead.model_validate(dict(row)).model_dump()
+
+
+@router_users.get("/stream")
+async def stream_all_users(current_user: Users = Depends(get_current_user)):
+    return ndjson_response(await prefetch(public_users(UserDAO.stream_all())))
+
+
 @router_users.get("/{user_id}")
-async def read_users_by_id(user_id: int):
-    user = await UserDAO.find_one_or_none(id=user_id)
+async def read_users_by_id(user_id: int, session: AsyncSession = Depends(get_session, scope="function")):
+    user = await UserDAO.find_one_or_none(session, id=user_id)
     if not user:
         raise UserNotFound
     return user
 
 
 @router_users.get("")
-async def read_all_users():
-    users = await UserDAO.find_all()
+async def read_all_users(
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = None,
+    session: AsyncSession = Depends(get_session, scope="function"),
+):
+    users, next_cursor = await UserDAO.find_page(limit, cursor, session=session)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return users
 
 
 @router_users.delete("/me")
-async def delete_users_me(current_user: Users = Depends(get_current_user)):
-    user = await UserDAO.find_one_or_none(id=current_user.id)
+async def delete_users_me(current_user: Users = Depends(get_current_user), session: AsyncSession = Depends(get_session, scope="function")):
+    user = await UserDAO.find_one_or_none(session, id=current_user.id)
     if not user:
         raise UserNotFound
-    await UserDAO.delete(id=user.id)
+    await UserDAO.delete(session, id=user.id)
     response = Response(status_code=204)
     response.delete_cookie(key="purchases_access_token")
     return response
     
 
 @router_users.delete("/{user_id}", status_code=204)
-async def delete_users_by_id(user_id: int):
-    user = await UserDAO.find_one_or_none(id=user_id)
+async def delete_users_by_id(user_id: int, session: AsyncSession = Depends(get_session, scope="function")):
+    user = await UserDAO.find_one_or_none(session, id=user_id)
     if not user:
         raise UserNotFound
-    await UserDAO.delete(id=user.id)
+    await UserDAO.delete(session, id=user.id)
 
 
 @router_users.patch("/me")
 async def update_users_me(
     update_data: UserUpdate,
     current_user: Users = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session, scope="function"),
 ):
     # Обновляем только те поля, которые переданы в запросе
     update_dict = update_data.model_dump(exclude_unset=True)  # Исключаем поля со значением None
@@ -96,7 +119,7 @@ async def update_users_me(
         raise NoDataProvidedForUpdate
     
     # Обновляем данные пользователя в базе данных
-    updated_user = await UserDAO.update(current_user.id, **update_dict)
+    updated_user = await UserDAO.update(current_user.id, session, **update_dict)
     if not updated_user:
         raise UserNotFound
 
@@ -31,4 +31,11 @@ class SUserAuth(BaseModel):
 
 class UserUpdate(BaseModel):
     email: EmailStr | None = None  # Поле email (необязательное)
-    name: str | None = None        # Поле name (необязательное)
\ No newline at end of file
+    name: str | None = None        # Поле name (необязательное)
+
+
+class SUserRead(BaseModel):
+    "Публичные поля пользователя: без hash_password"
+    id: int
+    name: str
+    email: str  # Уже сохраненные адреса не валидируем повторно